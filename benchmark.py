@@ -0,0 +1,344 @@
+# benchmark.py - Reproducible benchmarks for the conversion endpoints
+#
+# Generates synthetic datasets, drives /convert_to_csv and /convert_to_json
+# through the Flask test client and records wall time and throughput per stage
+# (the request, the download and the app's own Server-Timing stages) and peak
+# memory of the request and the download. Results can be saved as a baseline and later runs compared
+# against it with regression thresholds.
+#
+#   python benchmark.py --sizes 100KB,10MB
+#   python benchmark.py --sizes 10MB --save-baseline
+#   python benchmark.py --sizes 10MB --baseline benchmark_baseline.json --threshold 0.15
+#   python benchmark.py --sizes 10MB --json-backends
+#
+# The endpoint cases use the configured JSON backend; compare end to end by
+# running them again with JSON_BACKEND=json.
+
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import statistics
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Every run must do the full conversion work, and results must not pile up in
+# the real store, so configure the app before it is imported. Conversions run
+# inline at every size: in the pool, tracemalloc and RSS would only see this
+# process and the first run would include the pool's start-up. Set
+# INLINE_CONVERSION_MAX_BYTES to time the pool path instead (memory then
+# covers the parent only).
+os.environ['CONVERSION_CACHE_ENABLED'] = '0'
+os.environ.setdefault('RESULT_DIR', tempfile.mkdtemp(prefix='converter-bench-'))
+os.environ.setdefault('INLINE_CONVERSION_MAX_BYTES', str(2 ** 62))
+
+import convert  # noqa: E402
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+# --- Synthetic Datasets ---
+# Each generator yields records for row i; `rng` keeps every run identical.
+
+def _word(rng, length):
+    return ''.join(rng.choices(string.ascii_letters, k=length))
+
+def tall_flat(rng, i):
+    return {"id": i, "name": _word(rng, 8), "score": rng.random() * 100, "active": i % 2 == 0, "group": f"g{i % 20}"}
+
+def wide_flat(rng, i):
+    return {f"col_{c}": (rng.randint(0, 10 ** 6) if c % 2 else _word(rng, 6)) for c in range(200)}
+
+def nested(rng, i):
+    return {
+        "id": i,
+        "user": {"name": _word(rng, 8), "address": {"city": _word(rng, 6), "zip": f"{rng.randint(0, 99999):05d}"}},
+        "metrics": {"clicks": rng.randint(0, 500), "views": rng.randint(0, 5000)},
+        "tags": [_word(rng, 4) for _ in range(3)],
+    }
+
+def sparse(rng, i):
+    return {f"field_{c}": (rng.randint(0, 1000) if rng.random() < 0.3 else None) for c in range(20)}
+
+def long_strings(rng, i):
+    return {"id": i, "title": _word(rng, 64), "body": _word(rng, 1024)}
+
+DATASETS = {
+    "tall-flat": tall_flat,
+    "wide-flat": wide_flat,
+    "nested": nested,
+    "sparse": sparse,
+    "long-strings": long_strings,
+}
+# CSV has no nesting, so the nested shape only exercises JSON -> CSV
+CSV_DATASETS = [name for name in DATASETS if name != "nested"]
+
+def parse_size(text):
+    """'512KB' -> 524288."""
+    text = text.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+def write_dataset(path, dataset, target_bytes, fmt, seed=0):
+    """Write records of `dataset` to `path` as a JSON array or CSV until it reaches target_bytes."""
+    rng, make_record = random.Random(seed), DATASETS[dataset]
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        if fmt == 'json':
+            out.write('[')
+            while out.tell() < target_bytes or rows == 0:
+                out.write((',' if rows else '') + json.dumps(make_record(rng, rows)))
+                rows += 1
+            out.write(']')
+        else:
+            first = make_record(rng, 0)
+            writer = csv.DictWriter(out, fieldnames=list(first))
+            writer.writeheader()
+            writer.writerow(first)
+            rows = 1
+            while out.tell() < target_bytes:
+                writer.writerow(make_record(rng, rows))
+                rows += 1
+    return rows
+
+# --- Measurement ---
+# Wall times come from untraced runs: tracemalloc slows allocation-heavy code
+# several times over, so its cost would read as conversion time. Memory is
+# measured in one more run of each case, traced, in a fresh process, so the
+# RSS high-water mark starts from the imports rather than from the largest
+# case run before it.
+
+def _max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def timed(fn):
+    """(result, seconds) of one untraced call."""
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def traced(fn):
+    """(result, {'peak_alloc_bytes', 'rss_growth_bytes'}) of one call under tracemalloc."""
+    rss_before = _max_rss_bytes()
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, {"peak_alloc_bytes": peak, "rss_growth_bytes": _max_rss_bytes() - rss_before}
+
+def server_timings(response):
+    """The app's own stage durations (read, parse, normalize, write, ...) from Server-Timing, in seconds."""
+    stages = {}
+    for entry in response.headers.get('Server-Timing', '').split(','):
+        name, _, params = entry.strip().partition(';')
+        if name and params.startswith('dur='):
+            stages[name] = stages.get(name, 0) + float(params[len('dur='):]) / 1000
+    return stages
+
+def post_file(client, route, path, form):
+    with open(path, 'rb') as f:
+        response = client.post(route, data={**form, 'file': (f, os.path.basename(path))})
+        body = response.get_data()
+    if response.status_code != 200:
+        raise RuntimeError(f"{route} returned {response.status_code}: {body[:200]!r}")
+    return response, body
+
+def result_url(response):
+    return response.get_json().get('csv_url') or response.get_json().get('json_url')
+
+def run_case(client, route, path, form):
+    """POST one file to a route and download the result; returns untraced seconds per stage."""
+    (response, body), seconds = timed(lambda: post_file(client, route, path, form))
+    stages = {"convert": {"seconds": seconds}}
+    stages.update({f"server.{name}": {"seconds": seconds} for name, seconds in server_timings(response).items()})
+    if form.get('stream') != '1':
+        url = result_url(response)
+        body, seconds = timed(lambda: client.get(url).get_data())
+        stages["download"] = {"seconds": seconds}
+    stages["output_bytes"] = len(body)
+    return stages
+
+def case_memory(route, path, form, warmup_path):
+    """Peak allocations and RSS growth of the convert and download stages (runs in a fresh process)."""
+    client = convert.app.test_client()
+    # A small conversion first, so first-use imports and caches don't count
+    post_file(client, route, warmup_path, form)
+    (response, _), memory = traced(lambda: post_file(client, route, path, form))
+    stages = {"convert": memory}
+    if form.get('stream') != '1':
+        url = result_url(response)
+        stages["download"] = traced(lambda: client.get(url).get_data())[1]
+    return stages
+
+CASES = [
+    # (name, route, input format, extra form fields)
+    ("json-to-csv", "/convert_to_csv", "json", {}),
+    ("json-to-csv-stream", "/convert_to_csv", "json", {"stream": "1"}),
+    ("csv-to-json", "/convert_to_json", "csv", {}),
+    ("csv-to-json-stream", "/convert_to_json", "csv", {"stream": "1"}),
+]
+
+def run_benchmarks(sizes, datasets, cases, repeat, trace_memory):
+    client = convert.app.test_client()
+    results = {}
+    # One process per memory measurement (max_tasks_per_child), spawned like the app's pools
+    memory_pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'), max_tasks_per_child=1) if trace_memory else None
+    with tempfile.TemporaryDirectory(prefix='converter-bench-data-') as workdir:
+        for size_label, size in sizes:
+            for dataset in datasets:
+                inputs = {}
+                for case_name, route, fmt, form in cases:
+                    if fmt == 'csv' and dataset not in CSV_DATASETS: continue
+                    if fmt not in inputs:
+                        path = os.path.join(workdir, f"{dataset}-{size_label}.{fmt}")
+                        rows = write_dataset(path, dataset, size, fmt)
+                        warmup_path = os.path.join(workdir, f"{dataset}-warmup.{fmt}")
+                        write_dataset(warmup_path, dataset, 10 * SIZE_UNITS['KB'], fmt)
+                        inputs[fmt] = (path, rows, os.path.getsize(path), warmup_path)
+                    path, rows, input_bytes, warmup_path = inputs[fmt]
+                    runs = [run_case(client, route, path, form) for _ in range(repeat)]
+                    memory = memory_pool.submit(case_memory, route, path, form, warmup_path).result() if memory_pool else {}
+                    key = f"{case_name}/{dataset}/{size_label}"
+                    results[key] = summarize(runs, rows, input_bytes, memory)
+                    print(format_row(key, results[key]), flush=True)
+    if memory_pool: memory_pool.shutdown()
+    return results
+
+def run_json_backend_benchmarks(sizes, datasets, repeat, trace_memory):
+    """Parse each dataset and encode it back (as jsonify does) on every available JSON backend."""
+    backends = [b for b in convert.JSON_BACKENDS if b != 'orjson' or convert.orjson is not None]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='converter-bench-data-') as workdir:
+        for size_label, size in sizes:
+            for dataset in datasets:
+                path = os.path.join(workdir, f"{dataset}-{size_label}.json")
+                rows = write_dataset(path, dataset, size, 'json')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                for backend in backends:
+                    parse = lambda: convert.json_loads(data, backend)
+                    encode = lambda: convert.json_dumps(records, backend, sort_keys=True, default=convert.app.json.default)
+                    runs = []
+                    for _ in range(repeat):
+                        records, parse_seconds = timed(parse)
+                        text, encode_seconds = timed(encode)
+                        runs.append({"parse": {"seconds": parse_seconds}, "encode": {"seconds": encode_seconds},
+                                     "output_bytes": len(text)})
+                    memory = {}
+                    if trace_memory:
+                        # Peak allocations only: RSS in this long-lived process is a high-water mark
+                        records, memory["parse"] = traced(parse)
+                        memory["encode"] = traced(encode)[1]
+                        for stage in memory.values(): stage["rss_growth_bytes"] = None
+                    key = f"json-{backend}/{dataset}/{size_label}"
+                    results[key] = summarize(runs, rows, len(data), memory)
+                    stages = results[key]["stages"]
+                    print(f"{key:<45} {rows:>10} rows  parse {stages['parse']['seconds']:8.3f} s  "
+                          f"encode {stages['encode']['seconds']:8.3f} s", flush=True)
+                if len(backends) > 1:
+                    base, fast = (results[f"json-{b}/{dataset}/{size_label}"]["stages"] for b in ('json', backends[0]))
+                    print(f"{'':<45} {backends[0]} speedup: parse {base['parse']['seconds'] / fast['parse']['seconds']:.1f}x  "
+                          f"encode {base['encode']['seconds'] / fast['encode']['seconds']:.1f}x")
+    return results
+
+def summarize(runs, rows, input_bytes, memory=None):
+    """Median wall time of each stage across the untraced runs, with the traced run's memory."""
+    summary = {"rows": rows, "input_bytes": input_bytes, "output_bytes": runs[0]["output_bytes"], "stages": {}}
+    for stage in runs[0]:
+        if stage == "output_bytes": continue
+        seconds = statistics.median(run[stage]["seconds"] for run in runs if stage in run)
+        stage_memory = (memory or {}).get(stage, {})
+        summary["stages"][stage] = {
+            "seconds": seconds,
+            "mb_per_second": input_bytes / SIZE_UNITS['MB'] / seconds if seconds else None,
+            "rows_per_second": rows / seconds if seconds else None,
+            "peak_alloc_bytes": stage_memory.get("peak_alloc_bytes"),
+            "rss_growth_bytes": stage_memory.get("rss_growth_bytes"),
+        }
+    return summary
+
+def format_row(key, summary):
+    stage = summary["stages"]["convert"]
+    peak, rss = stage["peak_alloc_bytes"], stage["rss_growth_bytes"]
+    memory_text = f"{peak / SIZE_UNITS['MB']:8.1f} MB peak  {rss / SIZE_UNITS['MB']:8.1f} MB RSS" if peak is not None else ""
+    server = "  ".join(f"{name[len('server.'):]} {values['seconds']:.3f}" for name, values in summary["stages"].items()
+                       if name.startswith('server.') and name != 'server.total')
+    return (f"{key:<45} {summary['rows']:>10} rows  {stage['seconds']:8.3f} s  "
+            f"{stage['mb_per_second']:8.2f} MB/s  {memory_text}" + (f"\n{'':<45} {server}" if server else ""))
+
+# --- Baseline Comparison ---
+
+MIN_COMPARED_SECONDS = 0.01
+
+def compare(results, baseline, time_threshold, memory_threshold):
+    """List regressions of `results` against `baseline`, as human-readable strings."""
+    regressions = []
+    for key, summary in results.items():
+        base = baseline.get(key)
+        if base is None: continue
+        for stage, current in summary["stages"].items():
+            previous = base["stages"].get(stage)
+            if previous is None: continue
+            # Stages too short to time reliably (e.g. the app's respond stage) are left out
+            if max(current["seconds"], previous["seconds"]) >= MIN_COMPARED_SECONDS and current["seconds"] > previous["seconds"] * (1 + time_threshold):
+                regressions.append(f"{key} [{stage}] time {previous['seconds']:.3f}s -> {current['seconds']:.3f}s")
+            if current["peak_alloc_bytes"] and previous.get("peak_alloc_bytes"):
+                if current["peak_alloc_bytes"] > previous["peak_alloc_bytes"] * (1 + memory_threshold):
+                    regressions.append(
+                        f"{key} [{stage}] peak memory {previous['peak_alloc_bytes']} -> {current['peak_alloc_bytes']} bytes")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the conversion endpoints.")
+    parser.add_argument('--sizes', default='100KB,1MB', help="comma-separated input sizes, e.g. 100KB,10MB,1GB")
+    parser.add_argument('--datasets', default=','.join(DATASETS), help="comma-separated dataset shapes")
+    parser.add_argument('--cases', default=','.join(name for name, *_ in CASES), help="comma-separated cases")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the median time is kept")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="skip the traced memory run of each case (times only)")
+    parser.add_argument('--json-backends', action='store_true', help="benchmark JSON parsing/encoding per backend instead")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against this baseline file")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help="save results as the baseline")
+    parser.add_argument('--threshold', type=float, default=0.20, help="allowed relative slowdown (0.20 = 20%%)")
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help="allowed relative peak memory growth")
+    args = parser.parse_args(argv)
+
+    sizes = [(label.strip().upper(), parse_size(label)) for label in args.sizes.split(',')]
+    datasets = [d for d in args.datasets.split(',') if d in DATASETS]
+    cases = [case for case in CASES if case[0] in args.cases.split(',')]
+    if args.json_backends:
+        results = run_json_backend_benchmarks(sizes, datasets, args.repeat, not args.no_tracemalloc)
+    else:
+        results = run_benchmarks(sizes, datasets, cases, args.repeat, not args.no_tracemalloc)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.memory_threshold)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
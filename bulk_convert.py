@@ -0,0 +1,276 @@
+# bulk_convert.py - Convert directories of JSON/CSV files without the web tier
+#
+# Runs the same conversion core as the web app (convert.convert_content) over
+# files, directories or globs: JSON/JSON Lines become CSV (or Parquet/Arrow)
+# and CSV becomes JSON. Inputs are memory-mapped, files are converted in a pool
+# of worker processes, and each output is written to a temporary file and
+# renamed into place, so a reader never sees a partial file. A state file in
+# the output directory (or, converting in place, the nearest one at or above the
+# directory the inputs are under) records what each output was made from; unchanged inputs are skipped
+# on the next run, and earlier outputs are never taken for inputs.
+#
+#   python bulk_convert.py exports/ -o converted/
+#   python bulk_convert.py 'exports/**/*.json' -o converted/ --workers 8 --output parquet
+#   python bulk_convert.py exports/ -o converted/ --check hash --format jsonl
+#
+# Form options of the web routes are accepted as --field value (e.g.
+# --depth all, --lists explode, --usecols id,name, --where 'age>=30').
+
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.datastructures import MultiDict
+
+import convert
+
+STATE_FILE = '.bulk_convert_state.json'
+STATE_SAVE_EVERY = 50
+INPUT_SUFFIXES = convert.JSON_SUFFIXES + ('.csv',)
+# Form fields passed through to the shared option parsers, as in a web request
+FORM_FIELDS = ('output', 'compression', 'depth', 'sep', 'lists', 'engine', 'usecols', 'nrows', 'skiprows', 'dtype')
+
+# --- Inputs ---
+
+def find_inputs(patterns, recursive):
+    """`(path, relative_name)` for every JSON/CSV file named by the patterns.
+
+    Files found under a directory keep their path relative to it, so the
+    output tree mirrors the input tree; files named directly or by a glob are
+    placed by their base name.
+    """
+    found, seen = [], set()
+
+    def add(path, name):
+        path = os.path.abspath(path)
+        if path not in seen and path.lower().endswith(INPUT_SUFFIXES):
+            seen.add(path)
+            found.append((path, name))
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.')) if recursive else []
+                for file in sorted(f for f in files if not f.startswith('.')):
+                    path = os.path.join(root, file)
+                    add(path, os.path.relpath(path, pattern))
+        elif glob.has_magic(pattern):
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path): add(path, os.path.basename(path))
+        elif os.path.isfile(pattern):
+            add(pattern, os.path.basename(pattern))
+        else:
+            raise FileNotFoundError(f"No such file or directory: {pattern}")
+    return found
+
+def input_root(patterns):
+    """The directory every input pattern is under."""
+    roots = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            roots.append(pattern)
+        elif glob.has_magic(pattern):
+            parts = pattern.split(os.sep)
+            fixed = next(i for i, part in enumerate(parts) if glob.has_magic(part))
+            roots.append(os.sep.join(parts[:fixed]) or ('/' if pattern.startswith(os.sep) else '.'))
+        else:
+            roots.append(os.path.dirname(pattern) or '.')
+    return os.path.commonpath([os.path.abspath(root) for root in roots])
+
+def find_state(root):
+    """The nearest state file at or above `root`, so a run over part of a tree shares the tree's state."""
+    directory = root
+    while not os.path.exists(os.path.join(directory, STATE_FILE)):
+        parent = os.path.dirname(directory)
+        if parent == directory: return os.path.join(root, STATE_FILE)
+        directory = parent
+    return os.path.join(directory, STATE_FILE)
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def publish(tmp_path, dest):
+    """Rename a finished temporary file into place with the mode a plain open() would give dest.
+
+    Temporary files are created 0600; a replaced file keeps its mode, a new one
+    gets 0666 less the umask.
+    """
+    try:
+        mode = os.stat(dest).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, dest)
+
+# --- Conversion (runs in the worker processes) ---
+
+def convert_file(src, dest, options, digest=False):
+    """Convert src into dest atomically; returns the entry for the run's report.
+
+    With `digest`, the entry also has the input's SHA-256, taken from the same mapping.
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(dest), prefix='.tmp-', delete=False)
+    try:
+        with tmp, open(src, 'rb') as f:
+            # mmap can't map an empty file; the core reports it as empty input
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+            try:
+                result = convert.convert_content(os.path.basename(src), content, tmp, options)
+                sha256 = hashlib.sha256(content).hexdigest() if digest else None
+            finally:
+                if content: content.close()
+        publish(tmp.name, dest)
+    except Exception as e:
+        os.unlink(tmp.name)
+        error = str(e) if isinstance(e, convert.ConversionError) else f"Error processing data: {e}"
+        return {"error": error}
+    return {"total_rows": result["total_rows"], "output_bytes": result["output_bytes"],
+            "seconds": round(time.perf_counter() - start, 4), "sha256": sha256}
+
+# --- State ---
+# Maps each input's absolute path to the mtime, size and (with --check hash)
+# SHA-256 it had when its output was written, plus the options used.
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path) or '.', prefix='.tmp-', delete=False) as tmp:
+        json.dump(state, tmp, indent=1, sort_keys=True)
+    publish(tmp.name, path)
+
+def unchanged(previous, src, dest, stat, options_key, check):
+    """True when dest exists and was made from this version of src with the same options."""
+    if previous is None or previous['options'] != options_key or previous['output'] != dest: return False
+    if not os.path.exists(dest): return False
+    if previous['size'] != stat.st_size: return False
+    if previous['mtime_ns'] == stat.st_mtime_ns: return True
+    # Touched (or copied) but possibly identical: only a hash can tell
+    return check == 'hash' and previous.get('sha256') == file_digest(src)
+
+# --- Command Line ---
+
+def parse_options(args):
+    """The conversion options a web request with the same fields would get."""
+    values = MultiDict([(field, value) for field in FORM_FIELDS if (value := getattr(args, field)) is not None])
+    for where in args.where or []:
+        values.add('where', where)
+    return {
+        "columnar": convert.requested_columnar_output(values),
+        "csv_options": convert.requested_csv_options(values),
+        "lines": args.format == 'jsonl',
+        "pretty": not args.compact,
+        "flatten": convert.requested_flatten_options(values),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSON files to CSV and CSV files to JSON in bulk.")
+    parser.add_argument('inputs', nargs='+', help="files, directories or glob patterns ('**' matches subdirectories)")
+    parser.add_argument('-o', '--output-dir', help="where to write outputs (default: next to each input)")
+    parser.add_argument('--no-recursive', dest='recursive', action='store_false', help="don't descend into subdirectories")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--check', choices=('mtime', 'hash'), default='mtime',
+                        help="how to detect unchanged inputs: mtime and size, or also a SHA-256 of touched files")
+    parser.add_argument('--force', action='store_true', help="convert every input, even if unchanged")
+    parser.add_argument('--state', help=f"state file (default: {STATE_FILE} in the output directory or, converting "
+                                        "in place, the nearest one at or above the directory the inputs are under)")
+    parser.add_argument('--format', choices=('json', 'jsonl'), default='json', help="JSON output for CSV inputs")
+    parser.add_argument('--compact', action='store_true', help="don't indent JSON output")
+    parser.add_argument('--where', action='append', help="CSV row filter, e.g. 'age>=30' (repeatable)")
+    for field in FORM_FIELDS:
+        parser.add_argument(f'--{field}', help=f"same as the web form's `{field}` field")
+    args = parser.parse_args(argv)
+
+    try:
+        options = parse_options(args)
+        inputs = find_inputs(args.inputs, args.recursive)
+    except (ValueError, FileNotFoundError) as e:
+        parser.error(str(e))
+    options_key = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+    state_path = args.state or (os.path.join(args.output_dir, STATE_FILE) if args.output_dir else find_state(input_root(args.inputs)))
+    previous = load_state(state_path)
+    # Entries of files outside this run's inputs are kept for later runs
+    state = dict(previous)
+    # Outputs of earlier runs written next to their inputs are not inputs themselves:
+    # neither those the state file names nor any file another input converts to
+    # (unless the two convert to each other, which is reported below)
+    previous_outputs = {entry['output'] for entry in previous.values()}
+    dests = {}
+    for src, name in inputs:
+        base = os.path.splitext(name)[0] + convert.output_extension(convert.conversion_for(src), options)
+        dests[src] = os.path.abspath(os.path.join(args.output_dir, base) if args.output_dir else os.path.join(os.path.dirname(src), os.path.basename(base)))
+    derived = {dest for src, dest in dests.items() if dest in dests and dests[dest] != src}
+    inputs = [(path, name) for path, name in inputs
+              if path not in previous_outputs and path not in derived and path != os.path.abspath(state_path)]
+    input_paths = {path for path, _ in inputs}
+
+    jobs, outputs, skipped, failed, converted = {}, set(), 0, 0, 0
+    for src, name in inputs:
+        dest = dests[src]
+        if dest in input_paths or dest in outputs:
+            print(f"FAILED    {src}: its output {dest} would overwrite another input or output")
+            failed += 1
+            continue
+        # In place, a file this tool didn't write may be a source outside this run's inputs
+        if not args.output_dir and dest not in previous_outputs and os.path.exists(dest):
+            print(f"FAILED    {src}: its output {dest} already exists and was not written by an earlier run")
+            failed += 1
+            continue
+        outputs.add(dest)
+        stat = os.stat(src)
+        if not args.force and unchanged(state.get(src), src, dest, stat, options_key, args.check):
+            skipped += 1
+            continue
+        jobs[src] = (dest, stat)
+
+    # Pool processes are spawned, as in the web app, so they start from a clean import
+    # The state is saved as the run goes and however it ends, so finished files
+    # are skipped next time even if this run is killed or a worker dies
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs) or 1)), mp_context=context) as pool:
+            futures = {pool.submit(convert_file, src, dest, options, args.check == 'hash'): src for src, (dest, _) in jobs.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                src = futures[future]
+                dest, stat = jobs[src]
+                try:
+                    entry = future.result()
+                except BrokenProcessPool:
+                    # A worker was killed (often for memory); every file still in the pool fails with it
+                    entry = {"error": "The conversion process died (out of memory?); try fewer --workers."}
+                if "error" in entry:
+                    failed += 1
+                    state.pop(src, None)
+                    print(f"FAILED    {src}: {entry['error']}")
+                else:
+                    converted += 1
+                    state[src] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "output": dest, "options": options_key}
+                    if entry["sha256"]: state[src]["sha256"] = entry["sha256"]
+                    print(f"converted {src} -> {dest} ({entry['total_rows']} rows, {entry['seconds']:.2f} s)", flush=True)
+                if done % STATE_SAVE_EVERY == 0: save_state(state_path, state)
+    finally:
+        save_state(state_path, state)
+    print(f"{converted} converted, {skipped} unchanged, {failed} failed")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,57 @@
 # convert.py (Rewritten for Stateless Deployment)
 
-from flask import Flask, request, render_template_string, jsonify
+from flask import Flask, request, render_template_string, jsonify, Response, stream_with_context, send_file, url_for, g
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import dump_options_header
 import pandas as pd
+from pandas.api.types import is_numeric_dtype
+import numpy as np
 import json
+import math
+import datetime
+import operator
 from io import BytesIO, StringIO
 import os
+import re
+import codecs
+import time
+import secrets
+import queue
+import threading
+import fcntl
+import atexit
+import cProfile
+import pstats
+import tracemalloc
+import gzip
+import zlib
+try:
+    import brotli  # optional: enables br content coding
+except ImportError:
+    brotli = None
+try:
+    import zstandard  # optional: enables zstd content coding
+except ImportError:
+    zstandard = None
+try:
+    import orjson  # optional: faster JSON parsing and response encoding
+except ImportError:
+    orjson = None
+import hashlib
+import base64
+import tempfile
+import shutil
+import glob
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import islice, chain
+import unicodedata
+from urllib.parse import quote
 import smtplib
 from email.message import EmailMessage
-import base64 # <-- ADDED: For encoding file data into the download link
 
 app = Flask(__name__)
 
@@ -33,6 +77,8 @@ HTML_TEMPLATE = '''
         .results-area { display: none; }
         #spinner-j2c, #spinner-c2j { display: none; }
         .table th { cursor: pointer; user-select: none; }
+        .table th.sorted-asc::after { content: " \\25B2"; }
+        .table th.sorted-desc::after { content: " \\25BC"; }
         .table th:hover { background-color: #f1f1f1; }
         .table td.null { background-color: #fff0f1; }
         .toast-container { z-index: 1090; }
@@ -80,9 +126,9 @@ HTML_TEMPLATE = '''
                         <div class="tab-pane fade show active" id="j2c-upload-tab">
                             <div class="drop-zone" id="j2c-drop-zone">
                                 <div class="icon"><i class="bi bi-cloud-arrow-up-fill"></i></div>
-                                <p class="mb-0 mt-2"><strong>Drag & Drop</strong> a JSON file here or <strong>click to select</strong></p>
+                                <p class="mb-0 mt-2"><strong>Drag & Drop</strong> a JSON or JSON Lines file here or <strong>click to select</strong></p>
                             </div>
-                            <input type="file" id="j2c-file-input" accept=".json,application/json" class="d-none">
+                            <input type="file" id="j2c-file-input" accept=".json,.jsonl,.ndjson,.gz,.zip,.zst,application/json,application/x-ndjson" class="d-none">
                             <div class="file-info mt-3" id="j2c-file-info">
                                 <span><i class="bi bi-file-earmark-text"></i> <strong id="j2c-file-name"></strong></span>
                                 <span class="mx-2 badge bg-secondary" id="j2c-file-size"></span>
@@ -93,6 +139,34 @@ HTML_TEMPLATE = '''
                             <textarea id="j2c-text-input" class="form-control text-input" placeholder='[{"id": 1, "name": "John"}, {"id": 2, "name": "Jane"}]'></textarea>
                         </div>
                     </div>
+                    <div class="mt-3">
+                        <label for="j2c-output" class="form-label small text-muted mb-1">Output format</label>
+                        <select id="j2c-output" class="form-select form-select-sm">
+                            <option value="csv" selected>CSV (.csv)</option>
+                            <option value="parquet">Parquet (.parquet)</option>
+                            <option value="arrow">Arrow IPC (.arrow)</option>
+                        </select>
+                    </div>
+                    <div class="row g-2 mt-1">
+                        <div class="col">
+                            <label for="j2c-depth" class="form-label small text-muted mb-1">Flatten nested objects</label>
+                            <select id="j2c-depth" class="form-select form-select-sm">
+                                <option value="1" selected>1 level</option>
+                                <option value="2">2 levels</option>
+                                <option value="3">3 levels</option>
+                                <option value="all">All levels</option>
+                            </select>
+                        </div>
+                        <div class="col">
+                            <label for="j2c-lists" class="form-label small text-muted mb-1">Lists</label>
+                            <select id="j2c-lists" class="form-select form-select-sm">
+                                <option value="keep" selected>Keep as is</option>
+                                <option value="json">JSON text</option>
+                                <option value="index">One column per item</option>
+                                <option value="explode">One row per item</option>
+                            </select>
+                        </div>
+                    </div>
                     <div class="d-grid mt-4">
                         <button id="j2c-convert-btn" class="btn btn-primary btn-lg">
                             <span id="spinner-j2c" class="spinner-border spinner-border-sm me-2"></span>
@@ -107,11 +181,20 @@ HTML_TEMPLATE = '''
                     </div>
                     <div class="card shadow-sm">
                         <div class="card-header bg-light d-flex justify-content-between align-items-center">
-                            <h5><i class="bi bi-table me-2 text-primary"></i>CSV Preview (First 10 Rows)</h5>
+                            <h5><i class="bi bi-table me-2 text-primary"></i>CSV Preview</h5>
                             <a id="j2c-download-btn" class="btn btn-success btn-sm" href="#"><i class="bi bi-download"></i> Download Full CSV</a>
                         </div>
                         <div class="card-body">
-                            <p class="text-muted small mb-2">Click table headers to sort preview data.</p>
+                            <div class="row g-2 mb-2 align-items-center">
+                                <div class="col-auto"><select id="j2c-filter-column" class="form-select form-select-sm"></select></div>
+                                <div class="col"><input type="search" id="j2c-filter-text" class="form-control form-control-sm" placeholder="Filter rows containing..."></div>
+                                <div class="col-auto">
+                                    <button type="button" id="j2c-prev" class="btn btn-outline-secondary btn-sm"><i class="bi bi-chevron-left"></i></button>
+                                    <span id="j2c-page-info" class="small text-muted mx-2"></span>
+                                    <button type="button" id="j2c-next" class="btn btn-outline-secondary btn-sm"><i class="bi bi-chevron-right"></i></button>
+                                </div>
+                            </div>
+                            <p class="text-muted small mb-2">Click a column header to sort all rows.</p>
                             <div class="table-responsive"><table class="table table-bordered table-striped table-hover" id="j2c-preview-table"></table></div>
                         </div>
                     </div>
@@ -130,7 +213,7 @@ HTML_TEMPLATE = '''
                                 <div class="icon"><i class="bi bi-cloud-arrow-up-fill"></i></div>
                                 <p class="mb-0 mt-2"><strong>Drag & Drop</strong> a CSV file here or <strong>click to select</strong></p>
                             </div>
-                            <input type="file" id="c2j-file-input" accept=".csv,text/csv" class="d-none">
+                            <input type="file" id="c2j-file-input" accept=".csv,.gz,.zip,.zst,text/csv" class="d-none">
                             <div class="file-info mt-3" id="c2j-file-info">
                                 <span><i class="bi bi-file-earmark-spreadsheet"></i> <strong id="c2j-file-name"></strong></span>
                                 <span class="mx-2 badge bg-secondary" id="c2j-file-size"></span>
@@ -141,6 +224,25 @@ HTML_TEMPLATE = '''
                             <textarea id="c2j-text-input" class="form-control text-input" placeholder="id,name&#10;1,John&#10;2,Jane"></textarea>
                         </div>
                     </div>
+                    <div class="mt-3">
+                        <label for="c2j-format" class="form-label small text-muted mb-1">Output format</label>
+                        <select id="c2j-format" class="form-select form-select-sm">
+                            <option value="json" selected>JSON array (.json)</option>
+                            <option value="jsonl">JSON Lines (.jsonl)</option>
+                            <option value="parquet">Parquet (.parquet)</option>
+                            <option value="arrow">Arrow IPC (.arrow)</option>
+                        </select>
+                    </div>
+                    <div class="row g-2 mt-1">
+                        <div class="col">
+                            <label for="c2j-usecols" class="form-label small text-muted mb-1">Columns</label>
+                            <input type="text" id="c2j-usecols" class="form-control form-control-sm" placeholder="All (e.g. id,name)">
+                        </div>
+                        <div class="col">
+                            <label for="c2j-nrows" class="form-label small text-muted mb-1">Row limit</label>
+                            <input type="number" id="c2j-nrows" class="form-control form-control-sm" min="1" placeholder="All">
+                        </div>
+                    </div>
                     <div class="d-grid mt-4">
                         <button id="c2j-convert-btn" class="btn btn-primary btn-lg">
                             <span id="spinner-c2j" class="spinner-border spinner-border-sm me-2"></span>
@@ -155,13 +257,23 @@ HTML_TEMPLATE = '''
                     </div>
                     <div class="card shadow-sm">
                          <div class="card-header bg-light d-flex justify-content-between align-items-center">
-                            <h5><i class="bi bi-filetype-json me-2 text-warning"></i>JSON Output</h5>
+                            <h5><i class="bi bi-filetype-json me-2 text-warning"></i>JSON Preview</h5>
                             <div>
                                 <button id="c2j-copy-btn" class="btn btn-secondary btn-sm"><i class="bi bi-clipboard"></i> Copy</button>
                                 <a id="c2j-download-btn" class="btn btn-success btn-sm" href="#" download="data.json"><i class="bi bi-download"></i> Download .json</a>
                             </div>
                         </div>
                         <div class="card-body">
+                            <div class="row g-2 mb-2 align-items-center">
+                                <div class="col-auto"><select id="c2j-sort" class="form-select form-select-sm"></select></div>
+                                <div class="col-auto"><select id="c2j-filter-column" class="form-select form-select-sm"></select></div>
+                                <div class="col"><input type="search" id="c2j-filter-text" class="form-control form-control-sm" placeholder="Filter rows containing..."></div>
+                                <div class="col-auto">
+                                    <button type="button" id="c2j-prev" class="btn btn-outline-secondary btn-sm"><i class="bi bi-chevron-left"></i></button>
+                                    <span id="c2j-page-info" class="small text-muted mx-2"></span>
+                                    <button type="button" id="c2j-next" class="btn btn-outline-secondary btn-sm"><i class="bi bi-chevron-right"></i></button>
+                                </div>
+                            </div>
                             <textarea id="json-output" class="form-control text-input" readonly></textarea>
                         </div>
                     </div>
@@ -277,25 +389,128 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const displayStats = (result, containerId) => {
         const statsBody = document.getElementById(containerId);
-        let statsHtml = `<p><strong>Memory Usage:</strong> ${formatBytes(result.stats.memory_usage)}</p>`;
-        statsHtml += '<div class="table-responsive"><table class="table table-sm table-bordered"><thead><tr><th>Column</th><th>Data Type</th><th>Non-Null Count</th><th>Filled (%)</th></tr></thead><tbody>';
-        for (const col in result.stats.dtypes) {
-            const count = result.stats.non_null_counts[col];
+        const stats = result.stats;
+        const show = (value) => (value === null || value === undefined) ? '' : value;
+        let statsHtml = `<p><strong>Input Size:</strong> ${formatBytes(stats.input_bytes)}</p>`;
+        statsHtml += '<div class="table-responsive"><table class="table table-sm table-bordered"><thead><tr><th>Column</th><th>Data Type</th><th>Non-Null Count</th><th>Filled (%)</th><th>Distinct (approx.)</th><th>Min</th><th>Max</th></tr></thead><tbody>';
+        for (const col in stats.dtypes) {
+            const count = stats.non_null_counts[col];
             const filled = (count / result.total_rows * 100).toFixed(2);
-            statsHtml += `<tr><td>${col}</td><td>${result.stats.dtypes[col]}</td><td>${count}</td><td>${filled}%</td></tr>`;
+            statsHtml += `<tr><td>${col}</td><td>${stats.dtypes[col]} (${stats.inferred_types[col]})</td><td>${count}</td><td>${filled}%</td><td>${stats.distinct_counts[col]}</td><td>${show(stats.min[col])}</td><td>${show(stats.max[col])}</td></tr>`;
         }
         statsHtml += '</tbody></table></div>';
         statsBody.innerHTML = statsHtml;
     };
 
+    // Big files go through the job API: no request stays open for the whole
+    // conversion, and the button shows progress while it runs. The job is
+    // polled, so each check is a short request any worker can answer.
+    const ASYNC_JOB_MIN_BYTES = {{ async_job_min_bytes }};
+    const JOB_POLL_MS = {{ job_poll_ms }};
+    const runConversion = async (route, conversion, formData, size, btnText) => {
+        if (size < ASYNC_JOB_MIN_BYTES) {
+            const response = await fetch(route, { method: 'POST', body: formData });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error);
+            return result;
+        }
+        formData.append('conversion', conversion);
+        const response = await fetch('/jobs', { method: 'POST', body: formData });
+        const job = await response.json();
+        if (!response.ok) throw new Error(job.error);
+        while (true) {
+            let status, statusResponse;
+            try {
+                statusResponse = await fetch(job.status_url);
+                status = await statusResponse.json();
+            } catch (error) {
+                throw new Error('Lost connection to the conversion job.');
+            }
+            if (!statusResponse.ok) throw new Error(status.error);
+            if (status.state === 'done') return status.result;
+            if (status.state === 'failed' || status.state === 'cancelled') {
+                throw new Error(status.error || 'The conversion was cancelled.');
+            }
+            if (status.state === 'running' && status.bytes_total) {
+                const percent = Math.floor(status.bytes_done / status.bytes_total * 100);
+                btnText.textContent = `${status.phase === 'schema' ? 'Scanning' : 'Converting'}... ${percent}% (${status.rows.toLocaleString()} rows)`;
+            }
+            await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+        }
+    };
+
+    // --- Result Preview ---
+    // Paging, sorting and filtering run on the server over the whole result
+    // (/preview); the conversion response's first rows are shown until then.
+    const PREVIEW_ROWS = {{ preview_rows }};
+    const previews = {};
+    const setupPreview = (prefix, render) => {
+        const state = previews[prefix] = { url: null, page: 1, sort: null, order: 'asc', render };
+        const filterText = document.getElementById(`${prefix}-filter-text`);
+        state.load = async () => {
+            const params = new URLSearchParams({ page: state.page, page_size: PREVIEW_ROWS });
+            if (state.sort) { params.set('sort', state.sort); params.set('order', state.order); }
+            if (filterText.value.trim()) {
+                params.set('column', document.getElementById(`${prefix}-filter-column`).value);
+                params.set('q', filterText.value.trim());
+            }
+            try {
+                const response = await fetch(`${state.url}?${params}`);
+                const page = await response.json();
+                if (!response.ok) throw new Error(page.error || `Server error: ${response.status}`);
+                showPreviewPage(prefix, page);
+            } catch (error) {
+                showToast(`Preview failed: ${error.message}`);
+            }
+        };
+        document.getElementById(`${prefix}-prev`).addEventListener('click', () => { state.page--; state.load(); });
+        document.getElementById(`${prefix}-next`).addEventListener('click', () => { state.page++; state.load(); });
+        let filterTimer;
+        filterText.addEventListener('input', () => {
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(() => { state.page = 1; state.load(); }, 300);
+        });
+        document.getElementById(`${prefix}-filter-column`).addEventListener('change', () => {
+            if (filterText.value.trim()) { state.page = 1; state.load(); }
+        });
+    };
+    const showPreviewPage = (prefix, page) => {
+        const state = previews[prefix];
+        state.page = page.page;
+        state.render(page.columns, page.rows);
+        document.getElementById(`${prefix}-page-info`).textContent =
+            `Page ${page.page.toLocaleString()} of ${page.pages.toLocaleString()} (${page.matched_rows.toLocaleString()} rows)`;
+        document.getElementById(`${prefix}-prev`).disabled = !state.url || page.page <= 1;
+        document.getElementById(`${prefix}-next`).disabled = !state.url || page.page >= page.pages;
+    };
+    const startPreview = (prefix, url, columns, rows, totalRows) => {
+        Object.assign(previews[prefix], { url, page: 1, sort: null, order: 'asc' });
+        const filterColumn = document.getElementById(`${prefix}-filter-column`);
+        filterColumn.replaceChildren(...columns.map(col => new Option(col, col)));
+        document.getElementById(`${prefix}-filter-text`).value = '';
+        document.getElementById(`${prefix}-filter-text`).disabled = !url;
+        showPreviewPage(prefix, { columns, rows, page: 1, pages: Math.max(1, Math.ceil(totalRows / PREVIEW_ROWS)), matched_rows: totalRows });
+    };
+    const sortPreview = (prefix, column, order) => {
+        const state = previews[prefix];
+        if (!state.url) return;
+        state.order = order || (state.sort === column && state.order === 'asc' ? 'desc' : 'asc');
+        state.sort = column;
+        state.page = 1;
+        state.load();
+    };
+
     const renderJ2CTable = (columns, data) => {
         const previewTable = document.getElementById('j2c-preview-table');
+        const state = previews['j2c'];
         previewTable.innerHTML = '';
         const thead = document.createElement('thead');
         const headerRow = document.createElement('tr');
         columns.forEach(col => {
             const th = document.createElement('th');
             th.textContent = col;
+            if (state.sort === col) th.classList.add(`sorted-${state.order}`);
+            th.addEventListener('click', () => sortPreview('j2c', col));
             headerRow.appendChild(th);
         });
         thead.appendChild(headerRow);
@@ -317,6 +532,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- JSON to CSV Logic ---
     setupFileHandler('j2c');
+    setupPreview('j2c', renderJ2CTable);
     document.getElementById('j2c-convert-btn').addEventListener('click', async () => {
         const fileInput = document.getElementById('j2c-file-input');
         const textInput = document.getElementById('j2c-text-input');
@@ -341,18 +557,18 @@ document.addEventListener('DOMContentLoaded', () => {
         resultsArea.style.display = 'none';
         const formData = new FormData();
         formData.append('file', sourceData, fileName);
+        formData.append('output', document.getElementById('j2c-output').value);
+        formData.append('depth', document.getElementById('j2c-depth').value);
+        formData.append('lists', document.getElementById('j2c-lists').value);
         try {
-            const response = await fetch('/convert_to_csv', { method: 'POST', body: formData });
-            const result = await response.json();
-            if (!response.ok) throw new Error(result.error);
+            const result = await runConversion('/convert_to_csv', 'json-to-csv', formData, sourceData.size, btnText);
             displayStats(result, 'j2c-stats-body');
             
-            // --- JAVASCRIPT MODIFICATION ---
             const downloadBtn = document.getElementById('j2c-download-btn');
             downloadBtn.href = result.csv_url;
             downloadBtn.download = result.download_name; // Set filename for download
             
-            renderJ2CTable(result.preview_columns, result.preview_data);
+            startPreview('j2c', result.preview_url, result.preview_columns, result.preview_data, result.total_rows);
             resultsArea.style.display = 'block';
         } catch (error) {
             showToast(`Conversion failed: ${error.message}`);
@@ -365,6 +581,16 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // --- CSV to JSON Logic ---
     setupFileHandler('c2j');
+    setupPreview('c2j', (columns, rows) => {
+        // jsonify sorts keys, so restore the column order for display
+        const records = rows.map(row => Object.fromEntries(columns.map(col => [col, row[col]])));
+        document.getElementById('json-output').value = JSON.stringify(records, null, 2);
+    });
+    document.getElementById('c2j-sort').addEventListener('change', (e) => {
+        const [column, order] = JSON.parse(e.target.value || '[null, null]');
+        if (column === null) { previews['c2j'].sort = null; previews['c2j'].page = 1; previews['c2j'].load(); }
+        else sortPreview('c2j', column, order);
+    });
     document.getElementById('c2j-convert-btn').addEventListener('click', async () => {
         const fileInput = document.getElementById('c2j-file-input');
         const textInput = document.getElementById('c2j-text-input');
@@ -389,12 +615,20 @@ document.addEventListener('DOMContentLoaded', () => {
         resultsArea.style.display = 'none';
         const formData = new FormData();
         formData.append('file', sourceData, fileName);
+        const outputFormat = document.getElementById('c2j-format').value;
+        formData.append(['parquet', 'arrow'].includes(outputFormat) ? 'output' : 'format', outputFormat);
+        formData.append('usecols', document.getElementById('c2j-usecols').value);
+        formData.append('nrows', document.getElementById('c2j-nrows').value);
         try {
-            const response = await fetch('/convert_to_json', { method: 'POST', body: formData });
-            const result = await response.json();
-            if (!response.ok) throw new Error(result.error);
+            const result = await runConversion('/convert_to_json', 'csv-to-json', formData, sourceData.size, btnText);
             displayStats(result, 'c2j-stats-body');
-            document.getElementById('json-output').value = JSON.stringify(result.json_data, null, 2);
+            const sortSelect = document.getElementById('c2j-sort');
+            sortSelect.replaceChildren(new Option('Original order', ''), ...result.preview_columns.flatMap(col => [
+                new Option(`${col} (ascending)`, JSON.stringify([col, 'asc'])),
+                new Option(`${col} (descending)`, JSON.stringify([col, 'desc'])),
+            ]));
+            sortSelect.disabled = !result.preview_url;
+            startPreview('c2j', result.preview_url, result.preview_columns, result.preview_data, result.total_rows);
             const downloadBtn = document.getElementById('c2j-download-btn');
             downloadBtn.href = result.json_url;
             downloadBtn.download = result.json_name;
@@ -408,8 +642,12 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     document.getElementById('c2j-copy-btn').addEventListener('click', () => {
-        navigator.clipboard.writeText(document.getElementById('json-output').value)
-            .then(() => showToast("JSON copied to clipboard!", 'success'));
+        // The textarea only holds a preview, so copy the full result from the server
+        fetch(document.getElementById('c2j-download-btn').href)
+            .then(response => response.text())
+            .then(text => navigator.clipboard.writeText(text))
+            .then(() => showToast("JSON copied to clipboard!", 'success'))
+            .catch(error => showToast(`Copy failed: ${error.message}`));
     });
 
     // --- Bug Report Logic ---
@@ -455,22 +693,2078 @@ document.addEventListener('DOMContentLoaded', () => {
 </html>
 '''
 
-# --- DELETED ---
-# The in-memory FILE_STORE is no longer needed.
-
 # --- Email Configuration ---
 # These should be set as environment variables on your deployment platform (e.g., Render)
 SENDER_EMAIL = os.environ.get('GMAIL_EMAIL')
 SENDER_APP_PASSWORD = os.environ.get('GMAIL_APP_PASSWORD')
 RECIPIENT_EMAIL = SENDER_EMAIL
+# Point SMTP_HOST/SMTP_PORT at a local stand-in (with SMTP_USE_SSL=0) for testing.
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 465))
+SMTP_USE_SSL = os.environ.get('SMTP_USE_SSL', '1') == '1'
+MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', 100))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BASE_SECONDS = float(os.environ.get('MAIL_RETRY_BASE_SECONDS', 2))
+MAIL_IDLE_SECONDS = float(os.environ.get('MAIL_IDLE_SECONDS', 60))
+
+class MailSender:
+    """Delivers queued messages from a background thread over one reused SMTP connection.
+
+    The connection stays open between messages and is closed after
+    MAIL_IDLE_SECONDS without work. Failed sends reconnect and retry with
+    exponential backoff. The thread starts on first use, so it runs in each
+    gunicorn worker rather than in a preloading master.
+    """
+
+    def __init__(self, host, port, use_ssl, username, password, max_queue, max_attempts):
+        self.host, self.port, self.use_ssl = host, port, use_ssl
+        self.username, self.password = username, password
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._smtp = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, msg):
+        """Queue a message for delivery. Returns False if the queue is full."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mail-sender', daemon=True)
+                self._thread.start()
+        try:
+            self.queue.put_nowait(msg)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                msg = self.queue.get(timeout=MAIL_IDLE_SECONDS)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            try:
+                self._deliver(msg)
+            finally:
+                self.queue.task_done()
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=30)
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is None: return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    def _deliver(self, msg):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if self._smtp is None: self._smtp = self._connect()
+                self._smtp.send_message(msg)
+                return
+            except smtplib.SMTPAuthenticationError:
+                self._disconnect()
+                app.logger.error("Mail server authentication failed. Check credentials.")
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if attempt == self.max_attempts:
+                    app.logger.error("Dropping %r after %d attempts: %s", msg['Subject'], attempt, e)
+                    return
+                time.sleep(MAIL_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+
+MAIL_SENDER = MailSender(SMTP_HOST, SMTP_PORT, SMTP_USE_SSL, SENDER_EMAIL, SENDER_APP_PASSWORD,
+                         MAIL_QUEUE_SIZE, MAIL_MAX_ATTEMPTS)
+
+# --- JSON Backend ---
+# Upload parsing and JSON responses go through json_loads()/json_dumps(), which
+# use orjson when it is installed (JSON_BACKEND=json keeps the stdlib). orjson
+# only takes the common case: documents it rejects (NaN/Infinity literals,
+# lone surrogates) or would read differently (integers beyond 64 bits, which it
+# turns into floats) are parsed by the stdlib, so values and error messages are
+# unchanged, and values it can't encode itself
+# (dates, Decimal, ...) go through Flask's default hook, so dates are still
+# HTTP dates. Both backends write NaN/Infinity floats (e.g. inside list cells of
+# a lists=keep preview) as null, as orjson does, rather than the stdlib's
+# NaN/Infinity literals, which aren't valid JSON. The only difference left is
+# that orjson writes non-ASCII text as UTF-8 rather than \u escapes.
+JSON_BACKENDS = ('orjson', 'json')
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'orjson').strip().lower()
+if JSON_BACKEND not in JSON_BACKENDS or orjson is None: JSON_BACKEND = 'json'
+# Maps digits to '0', '.' to itself and everything else to 'x', so a run of 19+
+# digits that isn't a fraction (a possible integer beyond 64 bits) is one
+# substring search: translate() and `in` are far faster than a regex scan.
+_DIGIT_RUNS = bytes(48 if 48 <= i <= 57 else 46 if i == 46 else 120 for i in range(256))
+_LONG_INTEGER = b'x' + b'0' * 19
+
+def json_loads(data, backend=None):
+    """json.loads for str or bytes on the selected backend."""
+    if (backend or JSON_BACKEND) == 'orjson':
+        raw = data.encode('utf-8', 'surrogatepass') if isinstance(data, str) else data
+        try:
+            digits = raw.translate(_DIGIT_RUNS)
+            if _LONG_INTEGER not in digits and not digits.startswith(_LONG_INTEGER[1:]): return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+def json_dumps(obj, backend=None, sort_keys=False, indent=None, default=None):
+    """Compact (or indent=2) JSON text; json.dumps' defaults otherwise."""
+    if (backend or JSON_BACKEND) == 'orjson' and indent in (None, 2):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys: option |= orjson.OPT_SORT_KEYS
+        if indent: option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass
+    options = {"sort_keys": sort_keys, "indent": indent, "default": default, "separators": None if indent else (',', ':')}
+    try:
+        return json.dumps(obj, allow_nan=False, **options)
+    except ValueError as e:
+        # Only documents holding non-finite floats pay for the second pass
+        if 'Out of range float' not in str(e): raise
+        return json.dumps(_finite(obj), **options)
+
+def _finite(obj):
+    """obj with NaN/Infinity floats, at any depth, replaced by None."""
+    if isinstance(obj, float): return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict): return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)): return [_finite(value) for value in obj]
+    return obj
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider (jsonify, request.get_json) on the selected backend."""
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {'indent', 'separators', 'sort_keys'}:
+            return super().dumps(obj, **kwargs)
+        return json_dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys), indent=kwargs.get('indent'),
+                          default=self.default)
+
+    def loads(self, s, **kwargs):
+        return json_loads(s) if not kwargs else super().loads(s, **kwargs)
+
+app.json = JSONProvider(app)
+
+# --- Streaming Configuration ---
+# Uploads are read in STREAM_CHUNK_BYTES pieces and normalized STREAM_BATCH_ROWS
+# records at a time, so memory stays flat no matter how large the file is.
+STREAM_CHUNK_BYTES = int(os.environ.get('STREAM_CHUNK_BYTES', 64 * 1024))
+STREAM_BATCH_ROWS = int(os.environ.get('STREAM_BATCH_ROWS', 5000))
+# Responses only ever carry this many records; the full result is a download.
+PREVIEW_ROWS = int(os.environ.get('PREVIEW_ROWS', 10))
+
+# --- Result Store Configuration ---
+# Converted files are kept on local disk and served from /download/<file_id>.
+# The store lives in a shared directory so every gunicorn worker can serve it.
+RESULT_DIR = os.environ.get('RESULT_DIR') or os.path.join(tempfile.gettempdir(), 'converter-results')
+RESULT_TTL_SECONDS = int(os.environ.get('RESULT_TTL_SECONDS', 15 * 60))
+RESULT_STORE_MAX_BYTES = int(os.environ.get('RESULT_STORE_MAX_BYTES', 1024 ** 3))
+# Non-streaming results double as a content-addressed conversion cache: a repeat
+# upload with the same options is served from the store without reconverting.
+CONVERSION_CACHE_ENABLED = os.environ.get('CONVERSION_CACHE_ENABLED', '1') == '1'
+
+class ResultStore:
+    """Converted files on local disk, evicted by age (TTL) and total size.
+
+    Each result is a `<id>.data` file plus a `<id>.meta` JSON sidecar holding
+    its download name, mimetype and any caller `info`, and any variants made
+    from it (`<id>.data.<suffix>`, e.g. its gzip encoding). All state is in the
+    directory itself. Eviction removes the least recently touched results
+    first, so touching a cached result on every hit makes it an LRU.
+    """
+
+    FILE_ID = re.compile(r'^[A-Za-z0-9_-]{16}$')
+
+    def __init__(self, directory, ttl_seconds, max_bytes):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, file_id, suffix):
+        return os.path.join(self.directory, f"{file_id}.{suffix}")
+
+    @contextmanager
+    def create(self, download_name, mimetype, file_id=None, info=None):
+        """Yield `(file_id, binary_file)`; the result is published when the block exits."""
+        file_id = file_id or secrets.token_urlsafe(12)
+        tmp = tempfile.NamedTemporaryFile(dir=self.directory, prefix='.tmp-', delete=False)
+        try:
+            with tmp:
+                yield file_id, tmp
+            with open(self._path(file_id, 'meta'), 'w') as meta:
+                json.dump({"download_name": download_name, "mimetype": mimetype, "info": info}, meta)
+            os.replace(tmp.name, self._path(file_id, 'data'))
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+        self._remove_variants(file_id)
+        self.evict()
+
+    def save(self, chunks, download_name, mimetype, file_id=None):
+        """Write an iterable of str/bytes chunks as a new result and return its id."""
+        with self.create(download_name, mimetype, file_id=file_id) as (file_id, out):
+            for chunk in chunks:
+                out.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        return file_id
+
+    def get(self, file_id):
+        """Return `(path, meta)` for a live result, or None if unknown or expired."""
+        if not self.FILE_ID.match(file_id): return None
+        path = self._path(file_id, 'data')
+        try:
+            if os.stat(path).st_mtime + self.ttl_seconds < time.time(): return None
+            with open(self._path(file_id, 'meta')) as meta:
+                return path, json.load(meta)
+        except (OSError, ValueError):
+            return None
+
+    def variant(self, file_id, suffix, make):
+        """A copy derived from a result: `(path, None)` once made, else `(None, chunks)`.
+
+        `make(data_path)` yields the copy's bytes. The first caller gets them as
+        they are made, while they are also written to `<id>.data.<suffix>.part`
+        under an exclusive lock and published when complete; callers that come
+        meanwhile (in any worker) get a stream of their own, so a variant is
+        only ever being made once.
+        """
+        path = self._path(file_id, f'data.{suffix}')
+        if os.path.exists(path): return path, None
+        source = self._path(file_id, 'data')
+        part = open(f'{path}.part', 'ab')
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # The lock holder may have published the part (renaming it) before we locked it
+            if os.path.exists(path): return path, None
+            if os.stat(part.name).st_ino != os.fstat(part.fileno()).st_ino: raise BlockingIOError
+        except (BlockingIOError, FileNotFoundError):
+            part.close()
+            return None, make(source)
+        except BaseException:
+            part.close()
+            raise
+        part.truncate(0)
+        return None, self._tee(make(source), part, path)
+
+    @classmethod
+    def _tee(cls, chunks, part, path):
+        # The part is published or removed before closing it releases the lock
+        with part:
+            try:
+                for chunk in chunks:
+                    part.write(chunk)
+                    yield chunk
+            except BaseException:
+                # Including a client that disconnects midway: the next request starts over
+                cls._remove(part.name)
+                raise
+            try:
+                os.replace(part.name, path)
+            except FileNotFoundError:
+                pass  # the result was replaced or evicted meanwhile
+
+    def touch(self, file_id):
+        """Mark a result as just used, renewing its TTL and LRU position."""
+        for suffix in ('data', 'meta'):
+            try:
+                os.utime(self._path(file_id, suffix))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Drop expired files, then the oldest results until the store fits max_bytes."""
+        now, mtimes, sizes = time.time(), {}, {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if st.st_mtime + self.ttl_seconds < now:
+                    self._remove(entry.path)
+                    continue
+                file_id, _, suffix = entry.name.partition('.')
+                if suffix == 'data': mtimes[file_id] = st.st_mtime
+                # Variants count towards their result's size
+                if suffix.split('.')[0] == 'data': sizes[file_id] = sizes.get(file_id, 0) + st.st_size
+        total = sum(sizes.values())
+        for _, file_id in sorted((mtime, file_id) for file_id, mtime in mtimes.items()):
+            if total <= self.max_bytes: break
+            self._remove(self._path(file_id, 'data'))
+            self._remove(self._path(file_id, 'meta'))
+            self._remove_variants(file_id)
+            total -= sizes[file_id]
+
+    def _remove_variants(self, file_id):
+        for path in glob.glob(self._path(file_id, 'data.*')):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+RESULT_STORE = ResultStore(RESULT_DIR, RESULT_TTL_SECONDS, RESULT_STORE_MAX_BYTES)
+
+# --- Metrics ---
+# Each worker keeps its metrics in memory and periodically writes them to its own
+# file in METRICS_DIR; /metrics sums every file, so totals cover all gunicorn
+# workers. The files of workers that have exited are folded into retired.json,
+# so restarts don't leave one file each behind. Clear METRICS_DIR when
+# deploying to reset the counters.
+METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'converter-metrics')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 1))
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_HELP = {
+    "converter_stage_seconds": ("histogram", "Time spent in each conversion stage."),
+    "converter_requests_total": ("counter", "Conversion requests and jobs by outcome (ok, cached, rejected, error, cancelled)."),
+    "converter_bytes_in_total": ("counter", "Uploaded bytes read by conversions."),
+    "converter_bytes_out_total": ("counter", "Converted output bytes written."),
+    "converter_rows_total": ("counter", "Rows converted."),
+    "converter_columns_total": ("counter", "Columns converted, summed over conversions."),
+}
+
+class Metrics:
+    """Counters and stage-latency histograms of one worker, shared through a directory."""
+
+    def __init__(self, directory, flush_seconds):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._reset()
+
+    def _reset(self):
+        # Called again after a fork so a preloaded master's state isn't shared
+        self._pid = os.getpid()
+        self._path = os.path.join(self.directory, f"{self._pid}-{secrets.token_hex(4)}.json")
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+
+    @staticmethod
+    def _series(name, labels):
+        return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+    def inc(self, name, labels, value=1):
+        key = self._series(name, labels)
+        with self._lock:
+            if os.getpid() != self._pid: self._reset()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = self._series(name, labels)
+        with self._lock:
+            if os.getpid() != self._pid: self._reset()
+            # Per-bucket counts (the last one is +Inf), then sum and count
+            hist = self._histograms.setdefault(key, [0] * (len(STAGE_BUCKETS) + 3))
+            hist[next((i for i, bound in enumerate(STAGE_BUCKETS) if seconds <= bound), len(STAGE_BUCKETS))] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def record_conversion(self, route, outcome, stages=(), bytes_in=0, bytes_out=0, rows=0, columns=0):
+        """Record one conversion (or the streamed part of one) and flush if due."""
+        labels = {"route": route}
+        if outcome: self.inc("converter_requests_total", {**labels, "outcome": outcome})
+        for stage, seconds in stages:
+            self.observe("converter_stage_seconds", {**labels, "stage": stage}, seconds)
+        for name, value in (("converter_bytes_in_total", bytes_in), ("converter_bytes_out_total", bytes_out),
+                            ("converter_rows_total", rows), ("converter_columns_total", columns)):
+            if value: self.inc(name, labels, value)
+        if time.time() - self._last_flush >= self.flush_seconds: self.flush()
+
+    def flush(self):
+        with self._lock:
+            snapshot = {"counters": dict(self._counters), "histograms": {k: list(v) for k, v in self._histograms.items()}}
+            self._last_flush = time.time()
+            path = self._path
+        # Processes that never record anything (e.g. conversion pool processes) leave no file
+        if not snapshot["counters"] and not snapshot["histograms"]: return
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def _load(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _add(total, snapshot):
+        counters, histograms = total["counters"], total["histograms"]
+        for key, value in snapshot["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+        for key, values in snapshot["histograms"].items():
+            summed = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values): summed[i] += value
+
+    def prune(self):
+        """Fold the files of workers that have exited into retired.json."""
+        dead = [name for name in os.listdir(self.directory)
+                if name.endswith('.json') and (pid := name.partition('-')[0]).isdigit()
+                and int(pid) != os.getpid() and not process_alive(int(pid))]
+        if not dead: return
+        with open(os.path.join(self.directory, 'retired.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # `folded` names files already counted, in case removing them failed last time
+            retired = self._load('retired.json') or {"counters": {}, "histograms": {}, "folded": []}
+            folded = [name for name in retired["folded"] if os.path.exists(os.path.join(self.directory, name))]
+            for name in dead:
+                # Another worker may have folded it while we waited for the lock
+                if name in folded or (snapshot := self._load(name)) is None: continue
+                self._add(retired, snapshot)
+                folded.append(name)
+            retired["folded"] = folded
+            tmp = os.path.join(self.directory, 'retired.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(retired, f)
+            os.replace(tmp, os.path.join(self.directory, 'retired.json'))
+            for name in folded:
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def render(self):
+        """All workers' metrics summed, in the Prometheus text exposition format."""
+        self.flush()
+        self.prune()
+        total = {"counters": {}, "histograms": {}}
+        # Shared with other readers; a prune in progress would have a file counted twice
+        with open(os.path.join(self.directory, 'retired.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            for name in os.listdir(self.directory):
+                if name.endswith('.json') and (snapshot := self._load(name)) is not None: self._add(total, snapshot)
+        counters, histograms = total["counters"], total["histograms"]
+
+        lines = []
+        for metric, (kind, help_text) in METRIC_HELP.items():
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            if kind == "counter":
+                lines += [f"{key} {value}" for key, value in sorted(counters.items()) if key.startswith(metric + '{')]
+                continue
+            for key, values in sorted(histograms.items()):
+                if not key.startswith(metric + '{'): continue
+                labels, cumulative = key[len(metric) + 1:-1], 0
+                for bound, count in zip(STAGE_BUCKETS + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {values[-2]}")
+                lines.append(f"{metric}_count{{{labels}}} {values[-1]}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics(METRICS_DIR, METRICS_FLUSH_SECONDS)
+atexit.register(METRICS.flush)
+
+# --- Request Profiling ---
+# A conversion request is profiled (cProfile + tracemalloc peak) when it sends an
+# X-Profile-Token header matching PROFILE_TOKEN, or for every conversion when
+# PROFILE_CONVERSIONS=1. Reports go to the result store; the response links them.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_CONVERSIONS = os.environ.get('PROFILE_CONVERSIONS', '0') == '1'
+PROFILE_REPORT_LINES = int(os.environ.get('PROFILE_REPORT_LINES', 60))
+# cProfile and tracemalloc are process-wide, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+@contextmanager
+def timed_stage(name, timings=None):
+    """Time a block as conversion stage `name`, into `timings` or the current request's."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (g.setdefault('stage_timings', []) if timings is None else timings).append((name, time.perf_counter() - start))
+
+def note_conversion(**fields):
+    """Attach sizes/counts (bytes_in, bytes_out, rows, columns, cached) to the current request."""
+    g.setdefault('conversion', {}).update(fields)
+
+# --- Compressed Uploads ---
+# gzip, zip and zstd uploads are recognised by their magic bytes and decompressed
+# as they are read, so the parsers never see (or hold) the compressed form.
+COMPRESSED_SUFFIXES = ('.gz', '.gzip', '.zip', '.zst', '.zstd')
+
+def open_upload(file):
+    """The upload's content as a binary stream, plus its name without a compression suffix.
+
+    Each call rewinds the upload, so a second pass can simply open it again.
+    Zip archives must hold a single file, whose name is returned instead.
+    """
+    return open_compressed(file.stream, file.filename)
+
+def open_compressed(raw, filename):
+    """open_upload() for any seekable binary file."""
+    raw.seek(0)
+    magic = raw.read(4)
+    raw.seek(0)
+    name = filename or ''
+    if name.lower().endswith(COMPRESSED_SUFFIXES): name = name.rsplit('.', 1)[0]
+    if magic.startswith(b'\x1f\x8b'):
+        return gzip.GzipFile(fileobj=raw, mode='rb'), name
+    if magic == b'PK\x03\x04':
+        try:
+            archive = zipfile.ZipFile(raw)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid zip upload: {e}") from None
+        members = [m for m in archive.infolist() if not m.is_dir()]
+        if len(members) != 1: raise ValueError("Zip uploads must contain exactly one file.")
+        return archive.open(members[0]), os.path.basename(members[0].filename)
+    if magic == b'\x28\xb5\x2f\xfd':
+        if zstandard is None: raise ValueError("zstd-compressed uploads are not supported on this server.")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True), name
+    return raw, name
+
+class UploadOverBudget(Exception):
+    """Raised by read_upload() once an upload decompresses past its limit."""
+
+def read_upload(stream, chunk_size=STREAM_CHUNK_BYTES, limit=None):
+    """Read an upload in chunks, hashing it on the way. Returns `(content, sha256_digest)`.
+
+    With a `limit`, reading stops with UploadOverBudget as soon as more than
+    `limit` (decompressed) bytes have been read.
+    """
+    digest, parts, total = hashlib.sha256(), [], 0
+    while chunk := stream.read(chunk_size):
+        total += len(chunk)
+        if limit is not None and total > limit: raise UploadOverBudget()
+        digest.update(chunk)
+        parts.append(chunk)
+    return b''.join(parts), digest.digest()
+
+# --- Memory Budget ---
+# MAX_UPLOAD_BYTES becomes MAX_CONTENT_LENGTH, so a larger request is turned
+# away with a 413 from its Content-Length before the body is read. Werkzeug
+# spools multipart files over 500 KB to a temporary file, so an accepted upload
+# stays on disk until it is converted. A conversion whose estimated peak memory
+# is over CONVERSION_MEMORY_BUDGET takes the chunked path (the same passes a
+# background job makes) instead of loading the whole upload into a DataFrame.
+# Sizes recorded in compressed uploads are client-supplied (and gzip's is only
+# kept modulo 2**32), so they are never trusted: read_upload() counts the bytes
+# actually decompressed and stops at upload_budget().
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 2 * 1024 ** 3))
+CONVERSION_MEMORY_BUDGET = int(os.environ.get('CONVERSION_MEMORY_BUDGET', 512 * 1024 ** 2))
+# Peak bytes held per input byte by a whole-frame conversion, upload included
+# (parsed objects, the DataFrame and the output buffers), measured on the
+# benchmark datasets and rounded up.
+MEMORY_FACTORS = {'json-to-csv': 10, 'csv-to-json': 13}
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES or None
+
+def content_size(raw):
+    """Size of a seekable upload as stored, a lower bound on its content if it is compressed."""
+    size = raw.seek(0, os.SEEK_END)
+    raw.seek(0)
+    return size
+
+def over_memory_budget(conversion, input_bytes):
+    return 0 < CONVERSION_MEMORY_BUDGET < input_bytes * MEMORY_FACTORS[conversion]
+
+def upload_budget(conversion):
+    """The most (decompressed) input bytes a whole-frame conversion may read, or None."""
+    return CONVERSION_MEMORY_BUDGET // MEMORY_FACTORS[conversion] if CONVERSION_MEMORY_BUDGET > 0 else None
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Uploads are limited to {MAX_UPLOAD_BYTES // 1024 ** 2} MB."}), 413
+
+def conversion_cache_key(upload_digest, conversion, **options):
+    """Result-store id for an upload hash plus everything that affects the output."""
+    key = hashlib.sha256(upload_digest + json.dumps([conversion, options], sort_keys=True).encode())
+    return base64.urlsafe_b64encode(key.digest())[:16].decode()
+
+def cached_conversion(cache_key):
+    """The stored response fields for a cached conversion, or None on a miss."""
+    if not CONVERSION_CACHE_ENABLED: return None
+    cached = RESULT_STORE.get(cache_key)
+    if cached is None or cached[1].get('info') is None: return None
+    RESULT_STORE.touch(cache_key)
+    return cached[1]['info']
+
+_JSON_WS = re.compile(r'[ \t\n\r]*')
+_JSON_NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+def is_flag_set(name, default=False):
+    """True when a form field or query argument is set to a truthy value."""
+    value = request.values.get(name)
+    if value is None: return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def iter_json_records(stream, chunk_size=STREAM_CHUNK_BYTES):
+    """Yield the elements of a top-level JSON array one by one from a binary stream.
+
+    Only the current element and one read chunk are held in memory. Any other
+    top-level value (e.g. a single object) is parsed whole and yielded once.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parser = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+
+    def fill(min_size=0):
+        nonlocal buf, pos, eof
+        chunk = stream.read(max(chunk_size, min_size))
+        eof = not chunk
+        buf = buf[pos:] + decoder.decode(chunk, final=eof)
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            pos = _JSON_WS.match(buf, pos).end()
+            if pos < len(buf) or eof: return
+            fill()
+
+    def decode_value():
+        # A number that runs up to the end of the buffer may have been split
+        # across reads, so only accept a value once a non-numeric char follows.
+        while True:
+            try:
+                value, end = parser.raw_decode(buf, pos)
+                if eof or (end < len(buf) and buf[end] not in _JSON_NUMBER_CHARS): return value, end
+            except json.JSONDecodeError:
+                if eof: raise
+            fill(len(buf) - pos)
+
+    skip_ws()
+    if pos == len(buf): raise json.JSONDecodeError("Expecting value", buf, pos)
+    if buf[pos] != '[':
+        while not eof: fill()
+        yield parser.decode(buf[pos:])
+        return
+
+    pos += 1
+    skip_ws()
+    if buf.startswith(']', pos):
+        pos += 1
+    else:
+        while True:
+            record, pos = decode_value()
+            yield record
+            skip_ws()
+            if buf.startswith(',', pos):
+                pos += 1
+                skip_ws()
+            elif buf.startswith(']', pos):
+                pos += 1
+                break
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+    skip_ws()
+    if pos != len(buf): raise json.JSONDecodeError("Extra data", buf, pos)
+
+def iter_json_lines(stream):
+    """Yield one record per non-blank line of a JSON Lines (NDJSON) binary stream."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip(): continue
+        try:
+            yield json_loads(line)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"{e.msg} on line {line_number}", e.doc, e.pos) from None
+
+def iter_records(stream, lines=False):
+    """Records of a JSON upload, either a JSON document or JSON Lines."""
+    return iter_json_lines(stream) if lines else iter_json_records(stream)
+
+def wants_json_lines(filename=None):
+    """True when the request asks for JSON Lines, or the upload is named .jsonl/.ndjson."""
+    fmt = request.values.get('format', '').strip().lower()
+    if fmt: return fmt in ('jsonl', 'ndjson')
+    return bool(filename and filename.lower().endswith(('.jsonl', '.ndjson')))
+
+def iter_batches(iterable, size=STREAM_BATCH_ROWS):
+    """Group an iterable into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+# --- Flattening ---
+FLATTEN_LIST_MODES = ('keep', 'json', 'index', 'explode')
+FLATTEN_SAMPLE_RECORDS = 1000
+
+class Flattener:
+    """Flattens JSON records into columns, like `pd.json_normalize(max_level=depth)` but faster.
+
+    Objects nested up to `depth` levels (None: any depth) become `parent<sep>child`
+    columns, in the order json_normalize gives them. Lists are kept as they are
+    ('keep'), JSON-encoded ('json'), spread over `key<sep>0`, `key<sep>1`, ...
+    columns ('index'), or exploded into one row per element ('explode'; lists
+    inside exploded elements are JSON-encoded). Outside 'keep' mode, objects
+    nested deeper than `depth` are JSON-encoded too.
+
+    The schema (a tree of keys -> columns) persists across calls, so the batches
+    of one upload line up, and values are written straight into per-column
+    lists allocated up front instead of building a dict per row.
+    """
+
+    def __init__(self, depth=1, sep='.', lists='keep'):
+        self.depth = depth
+        self.sep = sep
+        self.lists = lists
+        self.columns = []  # column names, in output order
+        self._root = {}  # key -> [column index or None, child keys or None, column name]
+        self._arrays = None
+        self._size = 0
+
+    def _entry(self, node, key, parent):
+        entry = node[key] = [None, None, f"{parent}{self.sep}{key}" if parent is not None else str(key)]
+        return entry
+
+    def _register(self, entry):
+        entry[0] = len(self.columns)
+        self.columns.append(entry[2])
+        if self._arrays is not None: self._arrays.append([np.nan] * self._size)
+        return entry[0]
+
+    def _set(self, entry, row, value):
+        index = entry[0] if entry[0] is not None else self._register(entry)
+        if self._arrays is not None: self._arrays[index][row] = value
+
+    def _nest(self, node, key, parent, value, level, row, deferred):
+        entry = node.get(key) or self._entry(node, key, parent)
+        if entry[1] is None: entry[1] = {}
+        self._walk(value, entry[1], entry[2], level + 1, row, deferred)
+
+    def _reserve(self, size):
+        # Exploded lists can outgrow the one-row-per-record allocation
+        if self._arrays is None or size <= self._size: return
+        grow = max(size - self._size, self._size)
+        for array in self._arrays: array.extend([np.nan] * grow)
+        self._size += grow
+
+    def _walk(self, record, node, parent, level, row, deferred):
+        expand = self.depth is None or level < self.depth
+        arrays, nested = self._arrays, None
+        for key, value in record.items():
+            kind = type(value)
+            if kind is dict or kind is list:
+                if expand and kind is list and self.lists == 'index':
+                    value, kind = dict(enumerate(value)), dict
+                if expand and kind is dict:
+                    # Like json_normalize: top-level objects are flattened after the
+                    # record's scalar keys, deeper ones in place
+                    if level:
+                        self._nest(node, key, parent, value, level, row, deferred)
+                    else:
+                        if nested is None: nested = []
+                        nested.append((key, value))
+                    continue
+                if expand and deferred is not None:
+                    deferred.append((node, key, parent, value, level))
+                    continue
+                if self.lists != 'keep': value = json.dumps(value, ensure_ascii=False)
+            entry = node.get(key) or self._entry(node, key, parent)
+            index = entry[0]
+            if index is None: index = self._register(entry)
+            if arrays is not None: arrays[index][row] = value
+        if nested:
+            for key, value in nested:
+                self._nest(node, key, parent, value, level, row, deferred)
+
+    def _add(self, record, row):
+        """Flatten one record into the rows from `row` on; returns how many rows it took."""
+        if not isinstance(record, dict): raise ValueError("JSON array elements must be objects.")
+        deferred = [] if self.lists == 'explode' else None
+        if deferred is not None: self._reserve(row + 1)
+        self._walk(record, self._root, None, 0, row, deferred)
+        if not deferred: return 1
+        rows = max(1, max(len(items) for *_, items, _ in deferred))
+        if self._arrays is not None:
+            self._reserve(row + rows)
+            # Every exploded row repeats the record's other values
+            for array in self._arrays:
+                value = array[row]
+                for extra in range(row + 1, row + rows): array[extra] = value
+        for node, key, parent, items, level in deferred:
+            entry = node.get(key) or self._entry(node, key, parent)
+            for offset, item in enumerate(items):
+                if isinstance(item, dict):
+                    self._nest(node, key, parent, item, level, row + offset, None)
+                else:
+                    if isinstance(item, list): item = json.dumps(item, ensure_ascii=False)
+                    self._set(entry, row + offset, item)
+        return rows
+
+    def discover(self, record):
+        """Add a record's columns to the schema without converting it; returns its row count."""
+        return self._add(record, 0)
+
+    def frame(self, records):
+        """Flatten a list of records into a DataFrame."""
+        if not self.columns:
+            # Settle the column order (and so the arrays to allocate) from a sample
+            for record in islice(records, FLATTEN_SAMPLE_RECORDS): self.discover(record)
+        self._size = len(records)
+        self._arrays = [[np.nan] * self._size for _ in self.columns]
+        try:
+            row = 0
+            for record in records:
+                row += self._add(record, row)
+            arrays = self._arrays
+        finally:
+            self._arrays = None
+        if row != self._size: arrays = [array[:row] for array in arrays]
+        return pd.DataFrame(dict(zip(self.columns, arrays)), index=pd.RangeIndex(row))
+
+def requested_flatten_options(values=None):
+    """Flattener settings from the `depth`, `sep` and `lists` fields (of the request unless given `values`)."""
+    values = request.values if values is None else values
+    depth = values.get('depth', '1').strip().lower()
+    if depth == 'all':
+        depth = None
+    elif depth.isdigit():
+        depth = int(depth)
+    else:
+        raise ValueError(f"Unsupported flatten depth '{depth}' (use a number or 'all').")
+    sep = values.get('sep', '.')
+    if not sep or len(sep) > 8: raise ValueError("The column separator must be 1-8 characters.")
+    lists = values.get('lists', 'keep').strip().lower()
+    if lists not in FLATTEN_LIST_MODES:
+        raise ValueError(f"Unsupported list handling '{lists}' (use one of: {', '.join(FLATTEN_LIST_MODES)}).")
+    return {"depth": depth, "sep": sep, "lists": lists}
+
+def scan_json_schema(stream, lines=False, flattener=None):
+    """Schema pass over a JSON upload: the union of output columns and the row count."""
+    flattener = flattener if flattener is not None else Flattener()
+    total_rows = 0
+    for record in iter_records(stream, lines):
+        total_rows += flattener.discover(record)
+    return list(flattener.columns), total_rows
+
+def stream_json_to_csv(stream, columns, profiler=None, lines=False, flattener=None):
+    """Yield CSV text for a JSON upload, one flattened batch at a time."""
+    flattener = flattener if flattener is not None else Flattener()
+    yield pd.DataFrame(columns=columns).to_csv(index=False)
+    for batch in iter_batches(iter_records(stream, lines)):
+        df = flattener.frame(batch).reindex(columns=columns)
+        if profiler is not None: profiler.update(df)
+        yield df.to_csv(index=False, header=False)
+
+def merge_dtypes(a, b):
+    """The dtype a column ends up with when two chunks inferred `a` and `b`."""
+    if a == b: return a
+    if is_numeric_dtype(a) and is_numeric_dtype(b):
+        try:
+            return np.result_type(a, b)
+        except TypeError:
+            pass  # extension (e.g. Arrow-backed) dtypes have no numpy promotion
+    return np.dtype(object)
+
+class DistinctSketch:
+    """HyperLogLog sketch estimating the number of distinct values in a column.
+
+    Registers take 2**precision bytes; the standard error is about
+    1.04 / sqrt(2**precision), i.e. ~1.6% at the default precision of 12.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        """Add a Series of non-null values."""
+        if values.empty: return
+        raw = values.to_numpy() if isinstance(values.dtype, np.dtype) else values.array
+        if values.dtype == object and pd.api.types.infer_dtype(raw, skipna=False) != 'string':
+            # Other cells (numbers, lists/dicts from JSON) are hashed by their str()
+            raw = values.astype(str).to_numpy()
+        hashes = pd.util.hash_array(raw, categorize=False)
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # Rank = position of the leftmost 1-bit in the remaining bits (frexp gives the bit length)
+        rank = (width + 1 - np.frexp(rest.astype(np.float64))[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros: return round(m * math.log(m / zeros))
+        return round(raw)
+
+def _json_scalar(value):
+    """Make a pandas/numpy min/max value safe for a JSON response."""
+    if isinstance(value, (datetime.date, datetime.time)): return value.isoformat()
+    if isinstance(value, np.generic): value = value.item()
+    if isinstance(value, float) and not math.isfinite(value): return str(value)
+    if isinstance(value, str) and len(value) > 100: return value[:100] + '…'
+    return value
+
+def _merge_bound(current, value, pick):
+    if current is None or value is None: return value if current is None else current
+    try:
+        return pick(current, value)
+    except TypeError:
+        return None
+
+# Min/max of an object (text) column costs a Python comparison per value, so it is
+# only worked out while the column has at most this many distinct values per chunk
+PROFILE_MINMAX_MAX_DISTINCT = int(os.environ.get('PROFILE_MINMAX_MAX_DISTINCT', 1000))
+
+class ColumnProfiler:
+    """Per-column stats built up one DataFrame chunk at a time while parsing.
+
+    Tracks non-null counts, pandas dtype, inferred value type, min/max and an
+    approximate distinct count. Profilers of separate chunks can be merged.
+    Min/max are left out (None) for object columns with many distinct values.
+    """
+
+    def __init__(self):
+        self.total_rows = 0
+        self.columns = {}
+
+    def update(self, df):
+        self.total_rows += len(df)
+        for col in df.columns:
+            self._merge_column(str(col), self._profile(df[col]))
+
+    @staticmethod
+    def _profile(series):
+        values = series.dropna() if series.hasnans else series
+        count = len(values)
+        if series.dtype == object:
+            # Text is costly to hash and compare, so a column that repeats a few values
+            # (going by its first cells) is profiled over its distinct values; deduping a
+            # mostly-unique one would only add a pass.
+            try:
+                head = values.iloc[:1000]
+                if len(set(head)) * 10 <= len(head): values = pd.Series(values.unique(), dtype=object)
+            except TypeError:
+                pass  # unhashable cells (lists/dicts from JSON)
+        profile = {
+            "dtype": series.dtype,
+            "inferred": pd.api.types.infer_dtype(values, skipna=False) if count else None,
+            "count": count,
+            "min": None,
+            "max": None,
+            "bounded": True,
+            "sketch": DistinctSketch(),
+        }
+        if count:
+            profile["sketch"].update(values)
+            if series.dtype == object and profile["sketch"].estimate() > PROFILE_MINMAX_MAX_DISTINCT:
+                profile["bounded"] = False
+            else:
+                try:
+                    # On the array itself: Series.min adds a null-masking pass
+                    bounds = values.to_numpy() if series.dtype == object else values
+                    profile["min"], profile["max"] = bounds.min(), bounds.max()
+                except TypeError:
+                    pass
+        return profile
+
+    def merge(self, other):
+        self.total_rows += other.total_rows
+        for col, profile in other.columns.items():
+            self._merge_column(col, profile)
+
+    def _merge_column(self, col, profile):
+        current = self.columns.get(col)
+        if current is None:
+            self.columns[col] = profile
+            return
+        current["dtype"] = merge_dtypes(current["dtype"], profile["dtype"])
+        if current["inferred"] is None or profile["inferred"] is None:
+            current["inferred"] = current["inferred"] or profile["inferred"]
+        elif current["inferred"] != profile["inferred"]:
+            current["inferred"] = "mixed"
+        current["count"] += profile["count"]
+        # A bound over only some of the chunks would be wrong, so an unbounded chunk clears it
+        current["bounded"] = current["bounded"] and profile["bounded"]
+        current["min"] = _merge_bound(current["min"], profile["min"], min) if current["bounded"] else None
+        current["max"] = _merge_bound(current["max"], profile["max"], max) if current["bounded"] else None
+        current["sketch"].merge(profile["sketch"])
+
+    def as_dict(self, input_bytes=None):
+        columns = self.columns.items()
+        return {
+            "input_bytes": input_bytes,
+            "dtypes": {col: str(p["dtype"]) for col, p in columns},
+            "inferred_types": {col: p["inferred"] or "empty" for col, p in columns},
+            "non_null_counts": {col: p["count"] for col, p in columns},
+            "min": {col: _json_scalar(p["min"]) for col, p in columns},
+            "max": {col: _json_scalar(p["max"]) for col, p in columns},
+            "distinct_counts": {col: p["sketch"].estimate() for col, p in columns},
+        }
+
+def profiled_stream(chunks, profiler, stats_id, stream):
+    """Pass a streamed response through, then publish its profile as /download/<stats_id>."""
+    start, bytes_out = time.perf_counter(), 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        bytes_out += len(data)
+        yield data
+    stats = profiler.as_dict(input_bytes=stream.tell())
+    RESULT_STORE.save([json.dumps({"total_rows": profiler.total_rows, "stats": stats})],
+                      'stats.json', 'application/json', file_id=stats_id)
+    METRICS.record_conversion(request.endpoint, None, [("stream", time.perf_counter() - start)],
+                              stream.tell(), bytes_out, profiler.total_rows, len(profiler.columns))
+
+def stream_csv_to_json(chunks, lines=False, profiler=None, indent=None):
+    """Yield a JSON array (or JSON Lines) for CSV chunks as each one is parsed."""
+    profiler = profiler if profiler is not None else ColumnProfiler()
+
+    def profiled():
+        for chunk in chunks:
+            profiler.update(chunk)
+            yield chunk
+
+    yield from json_records(profiled(), lines, indent)
+    app.logger.info("Streamed %d CSV rows as %s", profiler.total_rows, 'JSON Lines' if lines else 'JSON')
+
+def frame_chunks(df, rows=STREAM_BATCH_ROWS):
+    return (df.iloc[start:start + rows] for start in range(0, len(df), rows))
+
+def json_safe(df):
+    """df with the Arrow date, time and timestamp columns the pyarrow engine infers as ISO strings.
+
+    to_json would write dates as midnight timestamps; as strings they come out
+    as written in the CSV, as they do from the other engines.
+    """
+    arrow = {c: dtype.pyarrow_dtype for c, dtype in df.dtypes.items() if isinstance(dtype, pd.ArrowDtype)}
+    if not arrow: return df
+    import pyarrow as pa
+    temporal = [c for c, t in arrow.items() if pa.types.is_date(t) or pa.types.is_time(t) or pa.types.is_timestamp(t)]
+    return df.astype({c: pd.ArrowDtype(pa.string()) for c in temporal}) if temporal else df
+
+def json_records(chunks, lines=False, indent=None):
+    """Yield DataFrame chunks as one JSON array (or JSON Lines), a chunk at a time.
+
+    The text matches `to_json(orient='records', indent=...)` of the whole frame,
+    without the whole of it ever being held in memory.
+    """
+    if not lines: yield '['
+    for i, chunk in enumerate(chunks):
+        chunk = json_safe(chunk)
+        if lines:
+            yield chunk.to_json(orient='records', date_format='iso', lines=True).rstrip('\n') + '\n'
+        elif indent:
+            yield (',' if i else '') + chunk.to_json(orient='records', date_format='iso', indent=indent)[1:-2]
+        else:
+            yield (',' if i else '') + chunk.to_json(orient='records', date_format='iso')[1:-1]
+    if not lines: yield '\n]' if indent else ']'
+
+# --- Columnar Output (Parquet / Arrow IPC) ---
+# output: (extension, mimetype, supported compressions, default compression)
+COLUMNAR_OUTPUTS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet', ('snappy', 'zstd', 'gzip', 'brotli', 'lz4', 'none'), 'snappy'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file', ('lz4', 'zstd', 'none'), 'lz4'),
+}
+CSV_ENGINES = ('c', 'python', 'pyarrow')
+
+def requested_columnar_output(values=None):
+    """`(output, compression)` if Parquet/Arrow output was requested (in the request or `values`), else None."""
+    values = request.values if values is None else values
+    output = values.get('output', '').strip().lower()
+    if output in ('', 'csv', 'json'): return None
+    if output not in COLUMNAR_OUTPUTS: raise ValueError(f"Unsupported output format '{output}'.")
+    compressions, default = COLUMNAR_OUTPUTS[output][2:]
+    compression = values.get('compression', default).strip().lower()
+    if compression not in compressions:
+        raise ValueError(f"Unsupported {output} compression '{compression}' (use one of: {', '.join(compressions)}).")
+    return output, compression
+
+def write_columnar(df, out, output, compression):
+    """Write a DataFrame as Parquet or an Arrow IPC file (pyarrow is loaded on first use)."""
+    codec = None if compression == 'none' else compression
+    if output == 'parquet':
+        df.to_parquet(out, engine='pyarrow', compression=codec, index=False)
+    else:
+        df.to_feather(out, compression=codec or 'uncompressed')
+
+# --- CSV Read Options ---
+# Column projection, row ranges and dtype hints are handed to read_csv, so
+# skipped columns are never converted and parsing stops after nrows; row
+# filters run on each parsed chunk. `skip` and `where` are kept as plain data
+# (not callables) so the options can be pickled to pool processes.
+CSV_DTYPES = {'int': 'Int64', 'float': 'float64', 'str': 'str', 'bool': 'boolean', 'category': 'category', 'datetime': None}
+CSV_FILTER = re.compile(r'^(.+?)\s*(==|!=|>=|<=|>|<)\s*(.*)$')
+CSV_FILTER_OPS = {'==': operator.eq, '!=': operator.ne, '>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt}
+DTYPE_SAMPLE_ROWS = int(os.environ.get('DTYPE_SAMPLE_ROWS', 1000))
+
+def requested_csv_options(values=None):
+    """read_csv settings from the engine, usecols, nrows, skiprows, where and dtype fields
+    of the request, or of `values` (a MultiDict) when given.
+
+    pyarrow parses multi-threaded into Arrow dtypes but can't limit or skip rows.
+    """
+    values = request.values if values is None else values
+    engine = values.get('engine', 'c').strip().lower()
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unsupported CSV engine '{engine}' (use one of: {', '.join(CSV_ENGINES)}).")
+    options = {"engine": engine, "dtype_backend": "pyarrow"} if engine == 'pyarrow' else {"engine": engine}
+    if usecols := [c.strip() for c in values.get('usecols', '').split(',') if c.strip()]:
+        options['usecols'] = usecols
+    if nrows := values.get('nrows', '').strip():
+        if not nrows.isdigit(): raise ValueError(f"nrows must be a whole number, not '{nrows}'.")
+        options['nrows'] = int(nrows)
+    if skip := values.get('skiprows', '').strip():
+        options['skip'] = parse_row_ranges(skip)
+    filters = [f for value in values.getlist('where') for f in value.split(';') if f.strip()]
+    if filters:
+        options['where'] = [parse_row_filter(f) for f in filters]
+    if hints := values.get('dtype', '').strip():
+        for hint in hints.split(','):
+            if hint.strip().lower() == 'sample':
+                # pyarrow infers types natively (and a sample read needs nrows, which it lacks)
+                if engine != 'pyarrow': options['dtype_sample'] = True
+                continue
+            column, _, kind = hint.rpartition(':')
+            column, kind = column.strip(), kind.strip().lower()
+            if not column or kind not in CSV_DTYPES:
+                raise ValueError(f"Unsupported dtype hint '{hint}' (use column:type with one of: {', '.join(CSV_DTYPES)}, or 'sample').")
+            if kind == 'datetime':
+                options.setdefault('parse_dates', []).append(column)
+            else:
+                options.setdefault('dtype', {})[column] = CSV_DTYPES[kind]
+    if engine == 'pyarrow' and ('nrows' in options or 'skip' in options):
+        raise ValueError("The pyarrow engine cannot be combined with nrows or skiprows.")
+    return options
+
+def parse_row_ranges(text):
+    """'0-99,150' -> [(0, 99), (150, 150)]: 0-based data rows, header excluded."""
+    ranges = []
+    for part in text.split(','):
+        start, _, end = part.strip().partition('-')
+        if not start.isdigit() or (end and not end.isdigit()):
+            raise ValueError(f"Invalid row range '{part.strip()}' (use e.g. 0-99,150).")
+        ranges.append((int(start), int(end) if end else int(start)))
+    return ranges
+
+def parse_row_filter(text):
+    """'age >= 30' -> ('age', '>=', 30); quoted values stay strings."""
+    match = CSV_FILTER.match(text.strip())
+    if not match: raise ValueError(f"Invalid row filter '{text.strip()}' (use e.g. age>=30 or country==\"NZ\").")
+    column, op, value = match.groups()
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return column.strip(), op, value[1:-1]
+    for convert in (int, float):
+        try:
+            return column.strip(), op, convert(value)
+        except ValueError:
+            pass
+    if value.lower() in ('true', 'false'): return column.strip(), op, value.lower() == 'true'
+    return column.strip(), op, value
+
+class RowSkipper:
+    """skiprows callable for ranges of data rows (file line 0 is the header)."""
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+
+    def __call__(self, line):
+        return line > 0 and any(start <= line - 1 <= end for start, end in self.ranges)
+
+def filter_rows(df, filters, drop=()):
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        if column not in df.columns: raise ValueError(f"Unknown filter column '{column}'.")
+        mask &= CSV_FILTER_OPS[op](df[column], value).fillna(False).to_numpy(dtype=bool)
+    df = df[mask].reset_index(drop=True)
+    return df.drop(columns=list(drop)) if drop else df
+
+def read_csv(source, csv_options, chunksize=None):
+    """pd.read_csv with the request's options; with chunksize, an iterator of non-empty chunks."""
+    options = {k: v for k, v in csv_options.items() if k not in ('skip', 'where', 'dtype_sample')}
+    if 'skip' in csv_options: options['skiprows'] = RowSkipper(csv_options['skip'])
+    filters, extra = csv_options.get('where', []), []
+    if filters and 'usecols' in options:
+        # Filter columns have to be parsed even when they aren't wanted in the output
+        extra = [c for c, _, _ in filters if c not in options['usecols'] and c not in extra]
+        options['usecols'] = options['usecols'] + extra
+
+    def finish(df):
+        return filter_rows(df, filters, extra) if filters else df
+
+    if chunksize is not None:
+        def chunks():
+            for chunk in pd.read_csv(source, chunksize=chunksize, **options):
+                chunk = finish(chunk)
+                if not chunk.empty: yield chunk
+        return chunks()
+    # (an mmap has no seekable() but always can)
+    if csv_options.get('dtype_sample') and getattr(source, 'seekable', lambda: True)():
+        # Types inferred from the first rows skip inference on the rest; if a
+        # later row doesn't fit, parse again without them.
+        start = source.tell()
+        sample = pd.read_csv(source, **{**options, "nrows": min(options.get('nrows', DTYPE_SAMPLE_ROWS), DTYPE_SAMPLE_ROWS)})
+        hints = {c: dtype for c, dtype in sample.dtypes.items() if dtype.kind in 'iufb'}
+        source.seek(start)
+        try:
+            return finish(pd.read_csv(source, **{**options, "dtype": {**hints, **options.get('dtype', {})}}))
+        except (ValueError, TypeError):
+            source.seek(start)
+    return finish(pd.read_csv(source, **options))
+
+# --- Response Compression ---
+# Converted data (streamed conversions, downloads and large JSON responses) is
+# compressed on the fly with the best coding the client accepts. Bodies below
+# COMPRESSION_MIN_BYTES and already-compressed formats are sent as they are.
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+COMPRESSIBLE_MIMETYPES = {'text/csv', 'application/json', 'application/x-ndjson', 'text/plain'}
+STREAM_ENCODINGS = {'gzip'} | ({'br'} if brotli else set()) | ({'zstd'} if zstandard else set())
+
+def iter_compressed(chunks, encoding):
+    """Compress an iterable of bytes chunks incrementally with `encoding`."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(min(COMPRESSION_LEVEL, 9), zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=min(COMPRESSION_LEVEL, 11))
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compressobj()
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        if data := compress(chunk): yield data
+    yield finish()
+
+def iter_file(path, chunk_size=STREAM_CHUNK_BYTES):
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+def attachment_disposition(download_name):
+    """Content-Disposition for a download, quoted as send_file() does (RFC 5987 for non-ASCII names)."""
+    try:
+        download_name.encode('ascii')
+        return dump_options_header('attachment', {"filename": download_name})
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return dump_options_header('attachment', {"filename": simple, "filename*": f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"})
+
+def stream_response(chunks, mimetype, headers):
+    """A chunked conversion response, compressed as it is produced if the client allows."""
+    encoding = negotiate_encoding(STREAM_ENCODINGS)
+    if encoding != 'identity':
+        chunks = iter_compressed(chunks, encoding)
+        headers = {**headers, "Content-Encoding": encoding}
+    response = Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Buffered responses only; streams and downloads compress themselves
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES: return response
+    encoding = negotiate_encoding(STREAM_ENCODINGS)
+    if encoding == 'identity': return response
+    response.set_data(b''.join(iter_compressed([body], encoding)))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# --- Conversion Pool ---
+# pandas holds the GIL while parsing and normalizing, so conversions of inputs
+# above INLINE_CONVERSION_MAX_BYTES run in a per-worker process pool and the
+# worker's threads stay responsive. At most CONVERSION_QUEUE_LIMIT jobs may be
+# queued or running; beyond that requests are turned away at once with a 503.
+# Pool processes are spawned rather than forked, so they never inherit the
+# mail/metrics threads or locks.
+# The pools and the queue limit are per gunicorn worker: W workers start W pools
+# and admit W * CONVERSION_QUEUE_LIMIT jobs. The default sizes split the CPUs
+# between the WEB_CONCURRENCY workers (gunicorn's own default worker count);
+# set the sizes explicitly when the worker count is given some other way.
+WEB_WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+CONVERSION_POOL_SIZE = int(os.environ.get('CONVERSION_POOL_SIZE', max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+CONVERSION_QUEUE_LIMIT = int(os.environ.get('CONVERSION_QUEUE_LIMIT', CONVERSION_POOL_SIZE * 2))
+CONVERSION_TIMEOUT_SECONDS = float(os.environ.get('CONVERSION_TIMEOUT_SECONDS', 120))
+CONVERSION_RETRY_AFTER = int(os.environ.get('CONVERSION_RETRY_AFTER', 5))
+INLINE_CONVERSION_MAX_BYTES = int(os.environ.get('INLINE_CONVERSION_MAX_BYTES', 1024 * 1024))
+_pools, _pool_lock = {}, threading.Lock()
+_admission = threading.BoundedSemaphore(CONVERSION_QUEUE_LIMIT)
+
+class ConversionError(Exception):
+    """A failed conversion, with the message and HTTP status to answer with."""
+
+    def __init__(self, message, status=400, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = {"Retry-After": str(retry_after)} if retry_after else {}
+
+def process_pool(name, size):
+    """This worker's process pool `name`, started on first use (and again if a process died)."""
+    with _pool_lock:
+        pool = _pools.get(name)
+        if pool is None or pool._broken:
+            pool = _pools[name] = ProcessPoolExecutor(size, mp_context=multiprocessing.get_context('spawn'))
+        return pool
+
+def conversion_pool():
+    return process_pool('conversion', CONVERSION_POOL_SIZE)
+
+def submit_conversion(fn, *args, block=False):
+    """Submit a job to the pool if there is room, else raise a 503 ConversionError."""
+    if not _admission.acquire(blocking=block):
+        raise ConversionError("The server is busy converting other files. Please try again shortly.",
+                              status=503, retry_after=CONVERSION_RETRY_AFTER)
+    try:
+        future = conversion_pool().submit(fn, *args)
+    except BaseException:
+        _admission.release()
+        raise
+    # The slot is held until the job really ends, even if its request timed out
+    future.add_done_callback(lambda _: _admission.release())
+    return future
+
+def pool_result(future):
+    """Wait for a pool job, raising ConversionErrors if it times out or its process dies."""
+    try:
+        return future.result(timeout=CONVERSION_TIMEOUT_SECONDS)
+    except TimeoutError:
+        future.cancel()
+        raise ConversionError("The conversion took too long and was abandoned.", status=504) from None
+    except BrokenProcessPool:
+        raise ConversionError("The conversion process crashed.", status=500) from None
+
+def run_conversion(job, input_bytes, *args):
+    """Run `job(*args)` inline for small inputs, otherwise in the pool; returns `(result, file_id)`.
+
+    Jobs return `(result, file_id, timings, counts)`; the timings and counts are
+    attached to the current request for metrics.
+    """
+    # Profiled requests stay inline so the profile covers the conversion itself
+    if input_bytes <= INLINE_CONVERSION_MAX_BYTES or g.get('profiler'):
+        result, file_id, timings, counts = job(*args)
+    else:
+        start = time.perf_counter()
+        result, file_id, timings, counts = pool_result(submit_conversion(job, *args))
+        timings = [("pool_wait", time.perf_counter() - start - sum(t for _, t in timings))] + timings
+    g.setdefault('stage_timings', []).extend(timings)
+    note_conversion(**counts)
+    return result, file_id
+
+_BLANK = re.compile(rb'\s*')
+
+def json_frame(raw, lines, timings, flatten=None):
+    """Parse and flatten a JSON (or JSON Lines) upload; `flatten` holds Flattener options."""
+    # json_loads takes the bytes itself, so no decoded copy outlives the parse.
+    # A memory-mapped file is read line by line, or copied once for a document.
+    try:
+        if _BLANK.fullmatch(raw): raise ConversionError("Input is empty.")
+        with timed_stage('parse', timings):
+            if lines:
+                data = list(iter_json_lines(BytesIO(raw) if isinstance(raw, bytes) else iter(raw.readline, b'')))
+            else:
+                data = json_loads(raw if isinstance(raw, bytes) else raw[:])
+        if isinstance(data, dict): data = [data]
+        with timed_stage('normalize', timings):
+            df = Flattener(**(flatten or {})).frame(data)
+    except ConversionError:
+        raise
+    except json.JSONDecodeError as e:
+        raise ConversionError(f"Invalid JSON: {e}") from None
+    except Exception as e:
+        raise ConversionError(f"Error processing data: {e}") from None
+    if df.empty: raise ConversionError("JSON resulted in empty data (must be an array of objects).")
+    return df
+
+def csv_frame(raw, csv_options, timings):
+    """Parse a CSV upload with the given read_csv options."""
+    # read_csv decodes the bytes as it parses, rather than from a decoded copy,
+    # and the C and pyarrow parsers read a memory-mapped file in place
+    try:
+        if _BLANK.fullmatch(raw): raise ConversionError("Input is empty.")
+        in_place = not isinstance(raw, bytes) and csv_options['engine'] != 'python'
+        with timed_stage('parse', timings):
+            df = read_csv(raw if in_place else BytesIO(raw), {**csv_options, "encoding": 'utf-8'})
+    except ConversionError:
+        raise
+    except pd.errors.ParserError as e:
+        raise ConversionError(f"Malformed CSV: {e}") from None
+    except Exception as e:
+        raise ConversionError(f"Error processing CSV: {e}") from None
+    if df.empty: raise ConversionError("CSV resulted in empty data.")
+    return df
+
+def profile_frame(df, input_bytes, timings):
+    with timed_stage('profile', timings):
+        profiler = ColumnProfiler()
+        profiler.update(df)
+        return profiler.as_dict(input_bytes=input_bytes)
+
+def json_to_csv_job(raw, lines, flatten, file_name, mimetype, columnar, cache_key):
+    """JSON upload -> CSV (or Parquet/Arrow) in the result store."""
+    timings = []
+    df = json_frame(raw, lines, timings, flatten)
+    result = {
+        "preview_data": df.head(PREVIEW_ROWS).fillna('null').to_dict(orient='records'),
+        "preview_columns": list(df.columns),
+        "download_name": file_name,
+        "total_rows": len(df),
+        "stats": profile_frame(df, len(raw), timings)
+    }
+
+    # Write the output straight into the result store; the response only carries its URL
+    try:
+        with timed_stage('write', timings), RESULT_STORE.create(file_name, mimetype, file_id=cache_key, info=result) as (file_id, out):
+            if columnar:
+                write_columnar(df, out, *columnar)
+            else:
+                df.to_csv(out, index=False, encoding='utf-8')
+            bytes_out = out.tell()
+    except Exception as e:
+        raise ConversionError(f"Error writing {os.path.splitext(file_name)[1][1:]} output: {e}") from None
+    return result, file_id, timings, {"bytes_out": bytes_out, "rows": len(df), "columns": len(df.columns)}
+
+def csv_to_json_job(raw, csv_options, lines, pretty, file_name, mimetype, columnar, cache_key):
+    """CSV upload -> JSON, JSON Lines (or Parquet/Arrow) in the result store."""
+    timings = []
+    df = csv_frame(raw, csv_options, timings)
+    result = {
+        "preview_data": json_loads(json_safe(df.head(PREVIEW_ROWS)).to_json(orient='records', date_format='iso')),
+        "preview_columns": list(df.columns),
+        "json_name": file_name,
+        "total_rows": len(df),
+        "stats": profile_frame(df, len(raw), timings)
+    }
+
+    # to_json writes NaN/NaT/None as null and dates as ISO strings in a single pass
+    # straight into the result store; only a bounded preview goes in the response.
+    try:
+        with timed_stage('write', timings), RESULT_STORE.create(file_name, mimetype, file_id=cache_key, info=result) as (file_id, out):
+            if columnar:
+                write_columnar(df, out, *columnar)
+            else:
+                for text in json_records(frame_chunks(df), lines, indent=2 if pretty else None):
+                    out.write(text.encode('utf-8'))
+            bytes_out = out.tell()
+    except Exception as e:
+        raise ConversionError(f"Error writing {os.path.splitext(file_name)[1][1:]} output: {e}") from None
+    return result, file_id, timings, {"bytes_out": bytes_out, "rows": len(df), "columns": len(df.columns)}
+
+# --- Batch Conversion ---
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+JSON_SUFFIXES = ('.json', '.jsonl', '.ndjson')
+
+def conversion_for(name):
+    """'json-to-csv' or 'csv-to-json' by file extension, or None for other files."""
+    lower = name.lower()
+    if lower.endswith(JSON_SUFFIXES): return 'json-to-csv'
+    if lower.endswith('.csv'): return 'csv-to-json'
+    return None
+
+def output_extension(conversion, options):
+    if options['columnar']: return COLUMNAR_OUTPUTS[options['columnar'][0]][0]
+    if conversion == 'json-to-csv': return '.csv'
+    return '.jsonl' if options['lines'] else '.json'
+
+def convert_content(name, content, out, options):
+    """Convert one file's content into the binary file `out`; the direction follows the name.
+
+    `content` is bytes or a read-only mmap of the file. This is all of a
+    conversion that needs neither Flask nor the result store, shared by batch
+    workers and bulk_convert.py. Returns `{"total_rows", "output_bytes", "stats"}`;
+    raises ConversionError for input it can't convert.
+    """
+    timings, conversion = [], conversion_for(name)
+    if conversion == 'json-to-csv':
+        df = json_frame(content, name.lower().endswith(('.jsonl', '.ndjson')), timings, options['flatten'])
+    elif conversion == 'csv-to-json':
+        df = csv_frame(content, options['csv_options'], timings)
+    else:
+        raise ConversionError("Unsupported file type (expected .json, .jsonl, .ndjson or .csv).")
+    start = out.tell()
+    try:
+        if options['columnar']:
+            write_columnar(df, out, *options['columnar'])
+        elif conversion == 'json-to-csv':
+            df.to_csv(out, index=False, encoding='utf-8')
+        else:
+            for text in json_records(frame_chunks(df), options['lines'], indent=2 if options['pretty'] else None):
+                out.write(text.encode('utf-8'))
+    except Exception as e:
+        raise ConversionError(f"Error writing output: {e}") from None
+    return {"total_rows": len(df), "output_bytes": out.tell() - start, "stats": profile_frame(df, len(content), timings)}
+
+def convert_upload(name, content, options):
+    """Convert one file's bytes in a pool process: JSON/JSON Lines to CSV, or CSV to JSON.
+
+    Takes and returns plain data only: `(output_name, output_bytes, manifest_entry)`,
+    with output_bytes None on failure.
+    """
+    start, out = time.perf_counter(), BytesIO()
+    output_name = name.rsplit('.', 1)[0] + output_extension(conversion_for(name), options)
+    try:
+        result = convert_content(name, content, out, options)
+    except ConversionError as e:
+        return None, None, {"name": name, "error": str(e)}
+    except Exception as e:
+        return None, None, {"name": name, "error": f"Error processing data: {e}"}
+    return output_name, out.getvalue(), {
+        "name": name,
+        "output": output_name,
+        "total_rows": result["total_rows"],
+        "output_bytes": result["output_bytes"],
+        "seconds": round(time.perf_counter() - start, 4),
+        "stats": result["stats"],
+    }
+
+def iter_batch_uploads(files):
+    """`(name, content)` for every uploaded file, expanding zip archives into their members.
+
+    content is None for a file over the memory budget, which is never read.
+    """
+    for file in files:
+        file.stream.seek(0)
+        if file.stream.read(4) == b'PK\x03\x04':
+            file.stream.seek(0)
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile as e:
+                raise ConversionError(f"Invalid zip upload '{file.filename}': {e}") from None
+            for member in archive.infolist():
+                if member.is_dir() or os.path.basename(member.filename).startswith('.'): continue
+                yield member.filename, batch_content(archive.open(member), member.filename)
+        else:
+            try:
+                stream, name = open_upload(file)
+                content = batch_content(stream, name or 'data')
+            except Exception as e:
+                raise ConversionError(f"Error reading upload '{file.filename}': {e}") from None
+            yield name or 'data', content
+
+def batch_content(stream, name):
+    """A batch file's content, or None once it reads past the memory budget."""
+    try:
+        return read_upload(stream, limit=upload_budget(conversion_for(name) or 'csv-to-json'))[0]
+    except UploadOverBudget:
+        return None
+
+def unique_name(name, taken):
+    """`name`, or `name` with a -2, -3, ... suffix if it is already in `taken`."""
+    stem, dot, ext = name.rpartition('.')
+    candidate, n = name, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{stem}-{n}.{ext}" if dot else f"{name}-{n}"
+    taken.add(candidate)
+    return candidate
+
+# --- Conversion Jobs ---
+# Long conversions can run as jobs: POST /jobs answers at once with a job id,
+# the conversion runs in a separate process pool, and clients poll /jobs/<id>
+# (as the web page does) or follow /jobs/<id>/events (server-sent events) for
+# progress. Job state is kept as small JSON files in JOBS_DIR, so any worker can
+# answer for any job. An event stream ties up a sync gunicorn worker while it is
+# open, so each one ends after JOB_EVENTS_MAX_SECONDS, well inside the worker
+# timeout, and EventSource clients reconnect to pick up where it left off.
+JOBS_DIR = os.environ.get('JOBS_DIR') or os.path.join(tempfile.gettempdir(), 'converter-jobs')
+# Per gunicorn worker, like CONVERSION_POOL_SIZE
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, (os.cpu_count() or 1) // 2 // WEB_WORKERS)))
+JOB_TABLE_SIZE = int(os.environ.get('JOB_TABLE_SIZE', 200))
+JOB_PROGRESS_SECONDS = float(os.environ.get('JOB_PROGRESS_SECONDS', 0.5))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+JOB_EVENTS_MAX_SECONDS = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', 20))
+# A job whose process is gone (its web worker exited with it still queued, or its
+# pool process died), or that hasn't been updated for this long, is failed.
+# Progress is written while the upload is read, so this must cover the longest
+# stretch without reads (the convert phase of a columnar or pyarrow job).
+JOB_STALL_SECONDS = float(os.environ.get('JOB_STALL_SECONDS', 30 * 60))
+# Uploads at least this large are sent to the job API by the web page
+ASYNC_JOB_MIN_BYTES = int(os.environ.get('ASYNC_JOB_MIN_BYTES', 20 * 1024 * 1024))
+JOB_CONVERSIONS = ('json-to-csv', 'csv-to-json')
+JOB_FINAL_STATES = ('done', 'failed', 'cancelled')
+
+class JobCancelled(Exception):
+    pass
+
+class JobTable:
+    """Conversion jobs stored as `<id>.json` status files, with the upload and a cancel flag beside them.
+
+    Finished jobs are dropped after ttl_seconds, or oldest first once the table
+    holds max_jobs; a full table of unfinished jobs refuses new ones. Stalled
+    jobs are failed by status() and then dropped like any other finished job.
+    """
+    JOB_ID = re.compile(r'^[A-Za-z0-9_-]{16}$')
+
+    def __init__(self, directory, max_jobs, ttl_seconds):
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, kind):
+        return os.path.join(self.directory, f"{job_id}.{kind}")
+
+    def create(self, stream, **fields):
+        """Save an upload as a new queued job and return its id, or None if the table is full."""
+        if not self.evict(room_for=1): return None
+        job_id = secrets.token_urlsafe(12)
+        with open(self._path(job_id, 'upload'), 'wb') as out:
+            stream.seek(0)
+            shutil.copyfileobj(stream, out, STREAM_CHUNK_BYTES)
+            size = out.tell()
+        now = time.time()
+        self._write(job_id, {"job_id": job_id, "state": "queued", "created": now, "updated": now,
+                             "bytes_total": size, "bytes_done": 0, "rows": 0, "owner": os.getpid(), **fields})
+        return job_id
+
+    def get(self, job_id):
+        if not self.JOB_ID.match(job_id): return None
+        try:
+            with open(self._path(job_id, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def status(self, job_id):
+        """get(), failing the job first if it has stalled."""
+        job = self.get(job_id)
+        if job is not None and job['state'] not in JOB_FINAL_STATES and self._stalled(job):
+            job = self.update(job_id, state='failed', finished=time.time(), error="The conversion stopped responding and was abandoned.")
+            ResultStore._remove(self.upload_path(job_id))
+        return job
+
+    @staticmethod
+    def _stalled(job):
+        # A queued job waits on the pool of the web worker that took it; a running one is in a pool process
+        pid = job.get('pid') if job['state'] == 'running' else job.get('owner')
+        if pid is not None and not process_alive(pid): return True
+        return job['updated'] + JOB_STALL_SECONDS < time.time()
+
+    def update(self, job_id, **fields):
+        job = self.get(job_id)
+        if job is None: return None
+        job.update(fields, updated=time.time())
+        self._write(job_id, job)
+        return job
+
+    def _write(self, job_id, job):
+        # Written whole and renamed into place, so readers never see half a file
+        tmp = self._path(job_id, f'json.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, self._path(job_id, 'json'))
+
+    def upload_path(self, job_id):
+        return self._path(job_id, 'upload')
+
+    def request_cancel(self, job_id):
+        open(self._path(job_id, 'cancel'), 'w').close()
+
+    def cancel_requested(self, job_id):
+        return os.path.exists(self._path(job_id, 'cancel'))
+
+    def remove(self, job_id):
+        for kind in ('json', 'upload', 'cancel'):
+            ResultStore._remove(self._path(job_id, kind))
+
+    def evict(self, room_for=0):
+        """Drop expired and surplus finished jobs; False if room_for more jobs still won't fit."""
+        now, finished, unfinished = time.time(), [], 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'): continue
+            job = self.status(name[:-len('.json')])
+            if job is None: continue
+            if job['state'] not in JOB_FINAL_STATES:
+                unfinished += 1
+            elif job['updated'] + self.ttl_seconds < now:
+                self.remove(job['job_id'])
+            else:
+                finished.append((job['updated'], job['job_id']))
+        surplus = unfinished + len(finished) + room_for - self.max_jobs
+        for _, job_id in sorted(finished)[:max(surplus, 0)]:
+            self.remove(job_id)
+        return unfinished + room_for <= self.max_jobs
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+JOBS = JobTable(JOBS_DIR, JOB_TABLE_SIZE, RESULT_TTL_SECONDS)
+_job_futures = {}
+
+class JobProgress:
+    """Read-through wrapper for a job's upload that publishes bytes read and rows converted.
+
+    Progress is written at most every JOB_PROGRESS_SECONDS, which is also when a
+    cancellation is noticed (as a JobCancelled raised from read()).
+    """
+
+    def __init__(self, job_id, raw):
+        self.job_id = job_id
+        self.raw = raw
+        self.phase = None
+        self.rows = 0
+        self.timings = []
+        self._last = 0.0
+        self._phase_start = 0.0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.report()
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def start_phase(self, phase):
+        self.end_phase()
+        self.phase, self._phase_start = phase, time.perf_counter()
+        self.report(force=True)
+
+    def end_phase(self):
+        """Record the time spent in the current phase, for the job's metrics."""
+        if self.phase is not None: self.timings.append((self.phase, time.perf_counter() - self._phase_start))
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < JOB_PROGRESS_SECONDS: return
+        self._last = now
+        if JOBS.cancel_requested(self.job_id): raise JobCancelled()
+        JOBS.update(self.job_id, phase=self.phase, bytes_done=self.raw.tell(), rows=self.rows)
+
+def run_job(job_id, conversion, upload_name, options):
+    """Run a queued job in a pool process; returns nothing, the outcome goes to JOBS and METRICS."""
+    outcome, progress, result = 'error', None, {}
+    try:
+        if JOBS.cancel_requested(job_id): raise JobCancelled()
+        JOBS.update(job_id, state='running', started=time.time(), pid=os.getpid())
+        with open(JOBS.upload_path(job_id), 'rb') as raw:
+            progress = JobProgress(job_id, raw)
+            if options['columnar'] or options['csv_options']['engine'] == 'pyarrow':
+                result = job_in_memory(progress, conversion, upload_name, options)
+            elif conversion == 'json-to-csv':
+                result = job_json_to_csv(progress, upload_name, options)
+            else:
+                result = job_csv_to_json(progress, upload_name, options)
+            progress.end_phase()
+        JOBS.update(job_id, state='done', finished=time.time(), bytes_done=os.path.getsize(JOBS.upload_path(job_id)),
+                    rows=result['total_rows'], result=result)
+        outcome = 'ok'
+    except JobCancelled:
+        JOBS.update(job_id, state='cancelled', finished=time.time())
+        outcome = 'cancelled'
+    except ConversionError as e:
+        JOBS.update(job_id, state='failed', finished=time.time(), error=str(e))
+    except Exception as e:
+        JOBS.update(job_id, state='failed', finished=time.time(), error=f"Error processing data: {e}")
+    finally:
+        ResultStore._remove(JOBS.upload_path(job_id))
+        stored = RESULT_STORE.get(result['file_id']) if result else None
+        METRICS.record_conversion('submit_job', outcome, progress.timings if progress else (),
+                                  (JOBS.get(job_id) or {}).get('bytes_total', 0), os.path.getsize(stored[0]) if stored else 0,
+                                  result.get('total_rows', 0), len(result.get('preview_columns', ())))
+        # Pool processes can be stopped without warning, so don't wait for the next flush
+        METRICS.flush()
+
+def job_output_name(upload_name, extension):
+    return (upload_name.rsplit('.', 1)[0] if upload_name else 'data') + extension
+
+def job_json_to_csv(progress, upload_name, options):
+    # Same two passes as the streaming route, written to the result store instead
+    progress.start_phase('schema')
+    flattener = Flattener(**options['flatten'])
+    try:
+        columns, total_rows = scan_json_schema(open_compressed(progress, upload_name)[0], options['lines'], flattener)
+    except json.JSONDecodeError as e:
+        raise ConversionError(f"Invalid JSON: {e}") from None
+    if not columns: raise ConversionError("JSON resulted in empty data (must be an array of objects).")
+    head = list(islice(iter_records(open_compressed(progress, upload_name)[0], options['lines']), PREVIEW_ROWS))
+    preview = Flattener(**options['flatten']).frame(head).head(PREVIEW_ROWS).reindex(columns=columns)
+
+    progress.start_phase('convert')
+    stream, profiler = open_compressed(progress, upload_name)[0], ColumnProfiler()
+    file_name = job_output_name(upload_name, '.csv')
+    with RESULT_STORE.create(file_name, 'text/csv') as (file_id, out):
+        for chunk in stream_json_to_csv(stream, columns, profiler, options['lines'], flattener):
+            out.write(chunk.encode('utf-8'))
+            progress.rows = profiler.total_rows
+    return {
+        "file_id": file_id,
+        "preview_data": preview.fillna('null').to_dict(orient='records'),
+        "preview_columns": columns,
+        "download_name": file_name,
+        "total_rows": total_rows,
+        "stats": profiler.as_dict(input_bytes=stream.tell()),
+    }
+
+def job_csv_to_json(progress, upload_name, options):
+    progress.start_phase('convert')
+    stream, lines = open_compressed(progress, upload_name)[0], options['lines']
+    try:
+        reader = read_csv(stream, {**options['csv_options'], "encoding": 'utf-8'}, chunksize=STREAM_BATCH_ROWS)
+        first_chunk = next(reader, None)
+    except pd.errors.EmptyDataError:
+        raise ConversionError("Input is empty.") from None
+    except pd.errors.ParserError as e:
+        raise ConversionError(f"Malformed CSV: {e}") from None
+    except ValueError as e:
+        raise ConversionError(f"Error processing CSV: {e}") from None
+    if first_chunk is None or first_chunk.empty: raise ConversionError("CSV resulted in empty data.")
+
+    profiler = ColumnProfiler()
+    extension, mimetype = ('.jsonl', 'application/x-ndjson') if lines else ('.json', 'application/json')
+    file_name = job_output_name(upload_name, extension)
+    with RESULT_STORE.create(file_name, mimetype) as (file_id, out):
+        chunks = stream_csv_to_json(chain([first_chunk], reader), lines, profiler, indent=2 if options['pretty'] else None)
+        for chunk in chunks:
+            out.write(chunk.encode('utf-8'))
+            progress.rows = profiler.total_rows
+    return {
+        "file_id": file_id,
+        "preview_data": json_loads(json_safe(first_chunk.head(PREVIEW_ROWS)).to_json(orient='records', date_format='iso')),
+        "preview_columns": list(first_chunk.columns),
+        "json_name": file_name,
+        "total_rows": profiler.total_rows,
+        "stats": profiler.as_dict(input_bytes=stream.tell()),
+    }
+
+def job_in_memory(progress, conversion, upload_name, options):
+    # Columnar outputs and the pyarrow engine need the whole frame, so only the read reports progress
+    progress.start_phase('read')
+    try:
+        raw, _ = read_upload(open_compressed(progress, upload_name)[0], limit=upload_budget(conversion))
+    except UploadOverBudget:
+        raise ConversionError("This file is too large for Parquet/Arrow output or the pyarrow engine here.", 413) from None
+    progress.start_phase('convert')
+    columnar = options['columnar']
+    if conversion == 'json-to-csv':
+        extension, mimetype = COLUMNAR_OUTPUTS[columnar[0]][:2] if columnar else ('.csv', 'text/csv')
+        result, file_id, _, _ = json_to_csv_job(raw, options['lines'], options['flatten'], job_output_name(upload_name, extension),
+                                                mimetype, columnar, None)
+    else:
+        if columnar:
+            extension, mimetype = COLUMNAR_OUTPUTS[columnar[0]][:2]
+        else:
+            extension, mimetype = ('.jsonl', 'application/x-ndjson') if options['lines'] else ('.json', 'application/json')
+        result, file_id, _, _ = csv_to_json_job(raw, options['csv_options'], options['lines'], options['pretty'],
+                                                job_output_name(upload_name, extension), mimetype, columnar, None)
+    return {**result, "file_id": file_id}
+
+class UploadPasses:
+    """Stands in for JobProgress when the chunked passes run inside a request."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def start_phase(self, phase):
+        pass
+
+def convert_in_chunks(conversion, file, upload_name, options):
+    """Convert an over-budget upload with the background jobs' chunked passes, in this request."""
+    convert = job_json_to_csv if conversion == 'json-to-csv' else job_csv_to_json
+    try:
+        with timed_stage('chunked'):
+            result = convert(UploadPasses(file.stream), upload_name, options)
+    except ConversionError as e:
+        return jsonify({"error": str(e)}), e.status, e.headers
+    except Exception as e:
+        return jsonify({"error": f"Error processing data: {e}"}), 400
+    note_conversion(rows=result['total_rows'], columns=len(result['preview_columns']))
+    file_id = result.pop('file_id')
+    key = 'csv_url' if conversion == 'json-to-csv' else 'json_url'
+    return jsonify({**result, key: url_for('download', file_id=file_id), "preview_url": url_for('preview', file_id=file_id)})
+
+def job_status(job):
+    """A job's status for clients, with the download URL once it is done."""
+    status = {k: v for k, v in job.items() if k not in ('options', 'owner', 'pid')}
+    if job.get('result'):
+        key = 'csv_url' if job['conversion'] == 'json-to-csv' else 'json_url'
+        file_id = job['result']['file_id']
+        status['result'] = {**job['result'], key: url_for('download', file_id=file_id),
+                            "preview_url": url_for('preview', file_id=file_id)}
+    status['status_url'] = url_for('job_info', job_id=job['job_id'])
+    status['events_url'] = url_for('job_events', job_id=job['job_id'])
+    return status
+
+def job_finished(job_id, future):
+    _job_futures.pop(job_id, None)
+    if not future.cancelled() and future.exception() is not None:
+        JOBS.update(job_id, state='failed', finished=time.time(), error="The conversion process crashed.")
+
+# --- Result Preview ---
+# /preview/<file_id> pages through a converted result with server-side sort and
+# filter. The first request loads the result into an uncompressed Arrow IPC copy
+# that later requests memory-map instead of re-parsing, and each column's sort
+# order is computed once and kept next to it, so serving a page only takes
+# page_size rows however large the result is. Parquet/Arrow results are copied
+# batch by batch; CSV/JSON results have to be parsed whole, so like a conversion
+# that happens in the conversion pool (inline when small) and is refused when
+# it would go over CONVERSION_MEMORY_BUDGET.
+PREVIEW_DIR = os.environ.get('PREVIEW_DIR') or os.path.join(tempfile.gettempdir(), 'converter-previews')
+PREVIEW_TTL_SECONDS = int(os.environ.get('PREVIEW_TTL_SECONDS', 10 * 60))
+PREVIEW_STORE_MAX_BYTES = int(os.environ.get('PREVIEW_STORE_MAX_BYTES', 512 * 1024 ** 2))
+PREVIEW_PAGE_SIZE = int(os.environ.get('PREVIEW_PAGE_SIZE', 50))
+PREVIEW_MAX_PAGE_SIZE = int(os.environ.get('PREVIEW_MAX_PAGE_SIZE', 500))
+PREVIEW_STORE = ResultStore(PREVIEW_DIR, PREVIEW_TTL_SECONDS, PREVIEW_STORE_MAX_BYTES)
+ARROW_MIMETYPE = COLUMNAR_OUTPUTS['arrow'][1]
+
+def derived_id(*parts):
+    """Store id for data derived from a result, e.g. a column's sort order."""
+    return base64.urlsafe_b64encode(hashlib.sha256('\0'.join(parts).encode()).digest()[:12]).decode()
+
+# Memory needed to parse a text result is taken to be that of converting from its format
+PREVIEW_MEMORY_FACTORS = {'text/csv': 'csv-to-json', 'application/json': 'json-to-csv', 'application/x-ndjson': 'json-to-csv'}
+
+def result_batches(path, mimetype):
+    """`(schema, record_batches)` of a stored result, whatever format it was written in."""
+    import pyarrow as pa
+    if mimetype == COLUMNAR_OUTPUTS['parquet'][1]:
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        return parquet.schema_arrow, parquet.iter_batches()
+    if mimetype == ARROW_MIMETYPE:
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        return reader.schema, (reader.get_batch(i) for i in range(reader.num_record_batches))
+    table = text_table(path, mimetype)
+    return table.schema, table.to_batches()
+
+def text_table(path, mimetype):
+    """Parse a CSV or JSON result whole into an Arrow table."""
+    import pyarrow as pa
+    if mimetype == 'text/csv':
+        df = pd.read_csv(path, low_memory=False)
+    elif mimetype in ('application/json', 'application/x-ndjson'):
+        df = pd.read_json(path, orient='records', lines=mimetype == 'application/x-ndjson', dtype=False, convert_dates=False)
+    else:
+        raise ValueError("This result can't be previewed.")
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Columns mixing types (e.g. nested values next to scalars) are shown as text
+        for column in df.columns[df.dtypes == object]:
+            values = df[column]
+            df[column] = values.where(values.isna(), values.map(lambda v: v if isinstance(v, str) else json.dumps(v, default=str)))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+def write_preview_table(store_id, path, mimetype):
+    """Copy a stored result into PREVIEW_STORE as an uncompressed Arrow IPC file (runs in the pool)."""
+    import pyarrow as pa
+    schema, batches = result_batches(path, mimetype)
+    with PREVIEW_STORE.create('preview.arrow', ARROW_MIMETYPE, file_id=store_id) as (_, out):
+        with pa.ipc.new_file(out, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+def stored_table(store_id, build):
+    """Memory-map an Arrow table kept in PREVIEW_STORE, writing it with build() first if needed."""
+    import pyarrow as pa
+    if (stored := PREVIEW_STORE.get(store_id)) is not None:
+        PREVIEW_STORE.touch(store_id)
+        return pa.ipc.open_file(pa.memory_map(stored[0])).read_all()
+    table = build()
+    if table is None: return None
+    with PREVIEW_STORE.create('preview.arrow', ARROW_MIMETYPE, file_id=store_id) as (_, out):
+        with pa.ipc.new_file(out, table.schema) as writer:
+            writer.write_table(table)
+    return table
+
+def preview_table(file_id):
+    """The result's Arrow copy, or None if the result is unknown or expired."""
+    store_id = derived_id(file_id, 'table')
+    if PREVIEW_STORE.get(store_id) is None:
+        if (result := RESULT_STORE.get(file_id)) is None: return None
+        path, meta = result
+        size, mimetype = os.path.getsize(path), meta['mimetype']
+        if mimetype in PREVIEW_MEMORY_FACTORS and over_memory_budget(PREVIEW_MEMORY_FACTORS[mimetype], size):
+            raise ConversionError("This result is too large to preview; download it instead.", status=413)
+        if size <= INLINE_CONVERSION_MAX_BYTES:
+            write_preview_table(store_id, path, mimetype)
+        else:
+            pool_result(submit_conversion(write_preview_table, store_id, path, mimetype))
+    return stored_table(store_id, lambda: None)
+
+def preview_page(file_id, page, page_size, sort=None, descending=False, column=None, query=None):
+    """One page of a result, optionally sorted by `sort` and filtered to rows whose
+    `column` contains `query` (case-insensitive). None if the result is gone."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    table = preview_table(file_id)
+    if table is None: return None
+    for name in (sort, column):
+        if name is not None and name not in table.column_names: raise ValueError(f"Unknown column '{name}'.")
+    rows = None
+    if sort is not None:
+        order = 'descending' if descending else 'ascending'
+        rows = stored_table(derived_id(file_id, 'sort', sort, order),
+                            lambda: pa.table({'row': pc.sort_indices(table, sort_keys=[(sort, order)])}))['row']
+    if query:
+        matches = pc.fill_null(pc.match_substring(pc.cast(table[column], pa.string()), query, ignore_case=True), False)
+        rows = pc.indices_nonzero(matches) if rows is None else pc.filter(rows, pc.take(matches, rows))
+    matched = len(table) if rows is None else len(rows)
+    start = (page - 1) * page_size
+    page_rows = table.slice(start, page_size) if rows is None else table.take(rows.slice(start, page_size))
+    return {
+        "columns": table.column_names,
+        "rows": json_loads(page_rows.to_pandas().to_json(orient='records', date_format='iso')),
+        "page": page,
+        "page_size": page_size,
+        "pages": max(1, math.ceil(matched / page_size)),
+        "total_rows": len(table),
+        "matched_rows": matched,
+    }
+
+# --- Index Page ---
+# The page depends only on configuration read at startup, so it is rendered and
+# compressed once per worker and then served from memory with an ETag and
+# long-lived caching. Changing that configuration needs a restart.
+INDEX_MAX_AGE = int(os.environ.get('INDEX_MAX_AGE', 24 * 3600))
+_index_page = None
+
+def negotiate_encoding(available):
+    """Best content coding in `available` the client accepts, or 'identity'."""
+    return request.accept_encodings.best_match([e for e in ('zstd', 'br', 'gzip') if e in available], default='identity')
+
+def index_page():
+    """`(variants, etag)` where variants maps content coding -> pre-rendered body."""
+    global _index_page
+    if _index_page is None:
+        html = render_template_string(HTML_TEMPLATE, async_job_min_bytes=ASYNC_JOB_MIN_BYTES, preview_rows=PREVIEW_ROWS,
+                                      job_poll_ms=int(JOB_POLL_SECONDS * 1000)).encode('utf-8')
+        variants = {'identity': html, 'gzip': gzip.compress(html, compresslevel=9, mtime=0)}
+        if brotli is not None: variants['br'] = brotli.compress(html, quality=11)
+        _index_page = variants, hashlib.sha256(html).hexdigest()[:20]
+    return _index_page
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    variants, etag = index_page()
+    encoding = negotiate_encoding(variants)
+    response = Response(variants[encoding], mimetype='text/html')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+        etag = f"{etag}-{encoding}"
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={INDEX_MAX_AGE}'
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
 
 @app.route('/submit_bug_report', methods=['POST'])
 def submit_bug_report():
-    if not SENDER_EMAIL or not SENDER_APP_PASSWORD:
+    if not SENDER_EMAIL or (SMTP_USE_SSL and not SENDER_APP_PASSWORD):
         return jsonify({"error": "Mail server is not configured. Please contact the administrator."}), 500
     if not RECIPIENT_EMAIL:
          return jsonify({"error": "Recipient email is not configured."}), 500
@@ -494,15 +2788,10 @@ def submit_bug_report():
         f"Message:\n{message}"
     )
 
-    try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp_server:
-            smtp_server.login(SENDER_EMAIL, SENDER_APP_PASSWORD)
-            smtp_server.send_message(msg)
-        return jsonify({"message": "Bug report submitted successfully."}), 200
-    except smtplib.SMTPAuthenticationError:
-        return jsonify({"error": "Mail server authentication failed. Check credentials."}), 500
-    except Exception as e:
-        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+    # Delivery happens on the background sender so the worker is free immediately
+    if not MAIL_SENDER.submit(msg):
+        return jsonify({"error": "Too many bug reports are pending. Please try again later."}), 503, {"Retry-After": "60"}
+    return jsonify({"message": "Bug report submitted successfully."}), 202
 
 
 @app.route('/convert_to_csv', methods=['POST'])
@@ -510,87 +2799,436 @@ def convert_to_csv():
     file = request.files.get('file')
     if not file: return jsonify({"error": "No file or text provided."}), 400
     try:
-        content = file.read().decode('utf-8')
-        if not content.strip(): return jsonify({"error": "Input is empty."}), 400
-        data = json.loads(content)
-        if isinstance(data, dict): data = [data]
-        df = pd.json_normalize(data, max_level=1)
+        input_bytes = content_size(file.stream)
+        stream, upload_name = open_upload(file)
+        columnar = requested_columnar_output()
+        flatten = requested_flatten_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    lines = wants_json_lines(upload_name)
+    if is_flag_set('stream'):
+        if columnar: return jsonify({"error": "Streaming is only available for CSV output."}), 400
+        return convert_to_csv_streaming(file, upload_name, lines, flatten)
+    if over_memory_budget('json-to-csv', input_bytes):
+        if columnar: return jsonify({"error": f"This file is too large to convert to {columnar[0]} here; choose CSV output instead."}), 413
+        note_conversion(bytes_in=input_bytes)
+        return convert_in_chunks('json-to-csv', file, upload_name, {"lines": lines, "flatten": flatten})
+
+    # Determine the download filename
+    extension, mimetype = COLUMNAR_OUTPUTS[columnar[0]][:2] if columnar else ('.csv', 'text/csv')
+    file_name = (upload_name.rsplit('.', 1)[0] if upload_name else 'data') + extension
+
+    try:
+        with timed_stage('read'):
+            raw, upload_digest = read_upload(stream, limit=upload_budget('json-to-csv'))
+    except UploadOverBudget:
+        # Only a compressed upload can get here: it inflated past what its size suggested
+        if columnar: return jsonify({"error": f"This file is too large to convert to {columnar[0]} here; choose CSV output instead."}), 413
+        return convert_in_chunks('json-to-csv', file, upload_name, {"lines": lines, "flatten": flatten})
+    except Exception as e:
+        return jsonify({"error": f"Error reading upload: {e}"}), 400
+    note_conversion(bytes_in=len(raw))
+    cache_key = conversion_cache_key(upload_digest, 'json-to-csv', download_name=file_name, lines=lines,
+                                     columnar=columnar, flatten=flatten)
+    if (cached := cached_conversion(cache_key)) is not None:
+        note_conversion(cached=True)
+        return jsonify({**cached, "csv_url": url_for('download', file_id=cache_key),
+                        "preview_url": url_for('preview', file_id=cache_key)})
+    try:
+        result, file_id = run_conversion(json_to_csv_job, len(raw), raw, lines, flatten, file_name, mimetype, columnar, cache_key)
+    except ConversionError as e:
+        return jsonify({"error": str(e)}), e.status, e.headers
+
+    with timed_stage('respond'):
+        return jsonify({**result, "csv_url": url_for('download', file_id=file_id),
+                        "preview_url": url_for('preview', file_id=file_id)})
+
+def convert_to_csv_streaming(file, upload_name, lines=False, flatten=None):
+    # A schema pass settles the header (and validates the whole document) before
+    # the first byte is sent; the second pass writes rows as batches are flattened.
+    flattener = Flattener(**(flatten or {}))
+    try:
+        with timed_stage('schema'):
+            columns, total_rows = scan_json_schema(open_upload(file)[0], lines, flattener)
     except json.JSONDecodeError as e:
         return jsonify({"error": f"Invalid JSON: {e}"}), 400
     except Exception as e:
         return jsonify({"error": f"Error processing data: {e}"}), 400
-    if df.empty: return jsonify({"error": "JSON resulted in empty data (must be an array of objects)."}), 400
-
-    stats = {
-        "memory_usage": int(df.memory_usage(deep=True).sum()),
-        "dtypes": df.dtypes.apply(lambda x: str(x)).to_dict(),
-        "non_null_counts": df.count().to_dict()
-    }
-    
-    # --- MODIFIED LOGIC ---
-    # Convert dataframe to a CSV string in memory
-    csv_buf = StringIO()
-    df.to_csv(csv_buf, index=False)
-    csv_string = csv_buf.getvalue()
-    
-    # Encode the string to Base64 and create a Data URI
-    b64_encoded = base64.b64encode(csv_string.encode('utf-8')).decode('utf-8')
-    csv_url = f"data:text/csv;base64,{b64_encoded}"
-    
-    # Determine the download filename
-    file_name = (file.filename.rsplit('.', 1)[0] + '.csv') if file.filename else 'data.csv'
+    if not columns: return jsonify({"error": "JSON resulted in empty data (must be an array of objects)."}), 400
 
-    return jsonify({
-        "preview_data": df.head(10).fillna('null').to_dict(orient='records'),
-        "preview_columns": list(df.columns),
-        "csv_url": csv_url,         # <-- MODIFIED: Send the Data URI
-        "download_name": file_name, # <-- ADDED: Send the filename for the download attribute
-        "total_rows": len(df),
-        "stats": stats
-    })
+    stream = open_upload(file)[0]
+    file_name = (upload_name.rsplit('.', 1)[0] + '.csv') if upload_name else 'data.csv'
+    # Column stats are profiled batch by batch and published once the stream ends
+    profiler, stats_id = ColumnProfiler(), secrets.token_urlsafe(12)
+    chunks = stream_json_to_csv(stream, columns, profiler, lines, flattener)
+    return stream_response(
+        profiled_stream(chunks, profiler, stats_id, stream),
+        mimetype='text/csv',
+        headers={
+            "Content-Disposition": attachment_disposition(file_name),
+            "X-Total-Rows": str(total_rows),
+            "X-Stats-URL": url_for('download', file_id=stats_id),
+        },
+    )
 
 @app.route('/convert_to_json', methods=['POST'])
 def convert_to_json():
     file = request.files.get('file')
     if not file: return jsonify({"error": "No file or text provided."}), 400
+    lines = wants_json_lines()
+    try:
+        input_bytes = content_size(file.stream)
+        stream, upload_name = open_upload(file)
+        columnar = requested_columnar_output()
+        csv_options = requested_csv_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if is_flag_set('stream'):
+        if columnar: return jsonify({"error": "Streaming is only available for JSON output."}), 400
+        if csv_options['engine'] == 'pyarrow': return jsonify({"error": "The pyarrow engine cannot be used for streaming."}), 400
+        return convert_to_json_streaming(stream, upload_name, lines, csv_options)
+    pretty = is_flag_set('pretty', default=True)
+    too_large = jsonify({"error": "This file is too large for Parquet/Arrow output or the pyarrow engine here; "
+                                  "choose JSON output and the default engine instead."}), 413
+    chunked_options = {"lines": lines, "pretty": pretty, "csv_options": csv_options}
+    if over_memory_budget('csv-to-json', input_bytes):
+        if columnar or csv_options['engine'] == 'pyarrow': return too_large
+        note_conversion(bytes_in=input_bytes)
+        return convert_in_chunks('csv-to-json', file, upload_name, chunked_options)
+
+    # Determine the download filename
+    if columnar:
+        extension, mimetype = COLUMNAR_OUTPUTS[columnar[0]][:2]
+    else:
+        extension, mimetype = ('.jsonl', 'application/x-ndjson') if lines else ('.json', 'application/json')
+    file_name = (upload_name.rsplit('.', 1)[0] if upload_name else 'data') + extension
+
+    try:
+        with timed_stage('read'):
+            raw, upload_digest = read_upload(stream, limit=upload_budget('csv-to-json'))
+    except UploadOverBudget:
+        if columnar or csv_options['engine'] == 'pyarrow': return too_large
+        return convert_in_chunks('csv-to-json', file, upload_name, chunked_options)
+    except Exception as e:
+        return jsonify({"error": f"Error reading upload: {e}"}), 400
+    note_conversion(bytes_in=len(raw))
+    cache_key = conversion_cache_key(upload_digest, 'csv-to-json', download_name=file_name, pretty=pretty,
+                                     lines=lines, columnar=columnar, csv=csv_options)
+    if (cached := cached_conversion(cache_key)) is not None:
+        note_conversion(cached=True)
+        return jsonify({**cached, "json_url": url_for('download', file_id=cache_key),
+                        "preview_url": url_for('preview', file_id=cache_key)})
+    try:
+        result, file_id = run_conversion(csv_to_json_job, len(raw), raw, csv_options, lines, pretty,
+                                         file_name, mimetype, columnar, cache_key)
+    except ConversionError as e:
+        return jsonify({"error": str(e)}), e.status, e.headers
+
+    with timed_stage('respond'):
+        return jsonify({**result, "json_url": url_for('download', file_id=file_id),
+                        "preview_url": url_for('preview', file_id=file_id)})
+
+def convert_to_json_streaming(stream, upload_name, lines=False, csv_options=None):
+    # The first chunk is parsed eagerly so malformed or empty input still gets a
+    # 400; the rest is read STREAM_BATCH_ROWS rows at a time while streaming.
     try:
-        content = file.read().decode('utf-8')
-        if not content.strip(): return jsonify({"error": "Input is empty."}), 400
-        df = pd.read_csv(StringIO(content))
+        with timed_stage('first_chunk'):
+            reader = read_csv(stream, {**(csv_options or {}), "encoding": 'utf-8'}, chunksize=STREAM_BATCH_ROWS)
+            first_chunk = next(reader, None)
+    except pd.errors.EmptyDataError:
+        return jsonify({"error": "Input is empty."}), 400
     except pd.errors.ParserError as e:
         return jsonify({"error": f"Malformed CSV: {e}"}), 400
     except Exception as e:
         return jsonify({"error": f"Error processing CSV: {e}"}), 400
-    if df.empty: return jsonify({"error": "CSV resulted in empty data."}), 400
-    
-    stats = {
-        "memory_usage": int(df.memory_usage(deep=True).sum()),
-        "dtypes": df.dtypes.apply(lambda x: str(x)).to_dict(),
-        "non_null_counts": df.count().to_dict()
-    }
-    df_clean = df.replace({pd.NA: None, pd.NaT: None}).where(pd.notna(df), None)
-    json_data = json.loads(df_clean.to_json(orient='records', date_format='iso'))
-    json_string = json.dumps(json_data, indent=2)
+    if first_chunk is None or first_chunk.empty: return jsonify({"error": "CSV resulted in empty data."}), 400
 
-    # --- MODIFIED LOGIC ---
-    # Encode the JSON string to Base64 and create a Data URI
-    b64_encoded = base64.b64encode(json_string.encode('utf-8')).decode('utf-8')
-    json_url = f"data:application/json;base64,{b64_encoded}"
+    extension, mimetype = ('.jsonl', 'application/x-ndjson') if lines else ('.json', 'application/json')
+    file_name = (upload_name.rsplit('.', 1)[0] if upload_name else 'data') + extension
+    profiler, stats_id = ColumnProfiler(), secrets.token_urlsafe(12)
+    chunks = stream_csv_to_json(chain([first_chunk], reader), lines=lines, profiler=profiler)
+    return stream_response(
+        profiled_stream(chunks, profiler, stats_id, stream),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": attachment_disposition(file_name),
+            "X-Stats-URL": url_for('download', file_id=stats_id),
+        },
+    )
 
-    # Determine the download filename
-    file_name = (file.filename.rsplit('.', 1)[0] + '.json') if file.filename else 'data.json'
-    
+@app.route('/convert_batch', methods=['POST'])
+def convert_batch():
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files: return jsonify({"error": "No files provided."}), 400
+    try:
+        options = {
+            "columnar": requested_columnar_output(),
+            "csv_options": requested_csv_options(),
+            "lines": wants_json_lines(),
+            "pretty": is_flag_set('pretty', default=True),
+            "flatten": requested_flatten_options(),
+        }
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Keep at most two files per pool process in flight, so a large batch is never
+    # held in memory (or pickled) all at once; results go into the zip as they finish.
+    window = CONVERSION_POOL_SIZE * 2
+    manifest, taken, pending, count = [], set(), {}, 0
+    totals = {"bytes_in": 0, "bytes_out": 0, "rows": 0}
+
+    def collect(done, archive):
+        for future in done:
+            try:
+                output_name, data, entry = future.result()
+            except BrokenProcessPool:
+                output_name, data, entry = None, None, {"name": pending[future], "error": "The conversion process crashed."}
+            del pending[future]
+            if data is not None:
+                entry["output"] = unique_name(output_name, taken)
+                archive.writestr(entry["output"], data)
+                totals["bytes_out"] += len(data)
+                totals["rows"] += entry["total_rows"]
+            manifest.append(entry)
+
+    try:
+        with timed_stage('batch'), RESULT_STORE.create('converted.zip', 'application/zip') as (file_id, out):
+            with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name, content in iter_batch_uploads(files):
+                    count += 1
+                    if count > BATCH_MAX_FILES: raise ConversionError(f"Batches are limited to {BATCH_MAX_FILES} files.")
+                    if content is None:
+                        manifest.append({"name": name, "error": "File is too large to convert in a batch; convert it on its own."})
+                        continue
+                    totals["bytes_in"] += len(content)
+                    if len(pending) >= window:
+                        collect(wait(pending, return_when=FIRST_COMPLETED).done, archive)
+                    # Only the first file can be turned away; once admitted, a batch waits its turn
+                    pending[submit_conversion(convert_upload, name, content, options, block=count > 1)] = name
+                if not count: raise ConversionError("No files provided.")
+                collect(wait(pending)[0], archive)
+                manifest.sort(key=lambda entry: entry["name"])
+                archive.writestr('manifest.json', json_dumps(manifest, indent=2))
+    except ConversionError as e:
+        for future in pending: future.cancel()
+        return jsonify({"error": str(e)}), e.status, e.headers
+    note_conversion(rows=totals["rows"], bytes_in=totals["bytes_in"], bytes_out=totals["bytes_out"])
+
+    failed = sum(1 for entry in manifest if "error" in entry)
     return jsonify({
-        "json_data": json_data,
-        "json_url": json_url, # <-- MODIFIED: Send the Data URI
-        "json_name": file_name,
-        "total_rows": len(df),
-        "stats": stats
+        "zip_url": url_for('download', file_id=file_id),
+        "download_name": 'converted.zip',
+        "total_files": len(manifest),
+        "failed_files": failed,
+        "files": manifest,
     })
 
-# --- DELETED ---
-# The /download/<file_id> route is no longer needed because the file data
-# is now embedded directly in the link provided to the frontend.
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    file = request.files.get('file')
+    if not file: return jsonify({"error": "No file or text provided."}), 400
+    conversion = request.values.get('conversion', '').strip().lower()
+    if conversion not in JOB_CONVERSIONS:
+        return jsonify({"error": f"Unsupported conversion '{conversion}' (use one of: {', '.join(JOB_CONVERSIONS)})."}), 400
+    try:
+        upload_name = open_upload(file)[1]
+        options = {
+            "columnar": requested_columnar_output(),
+            "csv_options": requested_csv_options(),
+            "lines": wants_json_lines(upload_name if conversion == 'json-to-csv' else None),
+            "pretty": is_flag_set('pretty', default=True),
+            "flatten": requested_flatten_options(),
+        }
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if (options['columnar'] or options['csv_options']['engine'] == 'pyarrow') and over_memory_budget(conversion, content_size(file.stream)):
+        return jsonify({"error": "This file is too large for Parquet/Arrow output or the pyarrow engine here."}), 413
+
+    job_id = JOBS.create(file.stream, conversion=conversion, name=upload_name)
+    if job_id is None:
+        return jsonify({"error": "Too many conversion jobs are running. Please try again later."}), 503, {"Retry-After": str(CONVERSION_RETRY_AFTER)}
+    future = process_pool('jobs', JOB_WORKERS).submit(run_job, job_id, conversion, upload_name, options)
+    _job_futures[job_id] = future
+    future.add_done_callback(lambda f: job_finished(job_id, f))
+    return jsonify(job_status(JOBS.get(job_id))), 202, {"Location": url_for('job_info', job_id=job_id)}
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_info(job_id):
+    job = JOBS.status(job_id)
+    if job is None: return jsonify({"error": "Job not found or expired."}), 404
+    if request.method == 'DELETE':
+        if job['state'] in JOB_FINAL_STATES: return jsonify({"error": f"Job is already {job['state']}."}), 409
+        JOBS.request_cancel(job_id)
+        # Still queued in this worker: it never starts. Otherwise the job notices the flag.
+        future = _job_futures.get(job_id)
+        if future is not None and future.cancel():
+            job = JOBS.update(job_id, state='cancelled', finished=time.time())
+        return jsonify(job_status(job)), 202
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if JOBS.status(job_id) is None: return jsonify({"error": "Job not found or expired."}), 404
+
+    def events():
+        # One event per status change, ending with the final state; comments keep proxies from timing out
+        last_update, last_sent = None, time.monotonic()
+        ends = last_sent + JOB_EVENTS_MAX_SECONDS
+        yield f"retry: {int(JOB_POLL_SECONDS * 1000)}\n\n"
+        while (job := JOBS.status(job_id)) is not None and time.monotonic() < ends:
+            if job['updated'] != last_update:
+                last_update, last_sent = job['updated'], time.monotonic()
+                yield f"data: {json_dumps(job_status(job))}\n\n"
+                if job['state'] in JOB_FINAL_STATES: return
+            elif time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(JOB_PROGRESS_SECONDS)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def profiling_requested():
+    if PROFILE_CONVERSIONS: return True
+    token = request.headers.get('X-Profile-Token')
+    return bool(PROFILE_TOKEN and token and secrets.compare_digest(token, PROFILE_TOKEN))
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    if request.endpoint in ('convert_to_csv', 'convert_to_json') and profiling_requested():
+        if not _profile_lock.acquire(blocking=False): return
+        g.profiler = cProfile.Profile()
+        g.started_tracemalloc = not tracemalloc.is_tracing()
+        if g.started_tracemalloc: tracemalloc.start()
+        tracemalloc.reset_peak()
+        g.profiler.enable()
+
+def save_request_profile(profiler, peak_bytes):
+    """Store a text report and the raw pstats dump; returns their result ids."""
+    with RESULT_STORE.create(f"{request.endpoint}-profile.prof", 'application/octet-stream') as (raw_id, out):
+        out.write(marshal_profile(profiler))
+    report = StringIO()
+    report.write(f"{request.method} {request.path}\n")
+    report.write(f"Peak traced memory: {peak_bytes:,} bytes\n")
+    report.write(f"Stages: {dict(g.get('stage_timings', []))}\n\n")
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_REPORT_LINES)
+    report_id = RESULT_STORE.save([report.getvalue()], f"{request.endpoint}-profile.txt", 'text/plain')
+    return report_id, raw_id
+
+def marshal_profile(profiler):
+    # pstats only writes dumps to a path, so go through a temporary file
+    with tempfile.NamedTemporaryFile(suffix='.prof') as tmp:
+        profiler.dump_stats(tmp.name)
+        return tmp.read()
+
+@app.after_request
+def finish_request_timing(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        if g.pop('started_tracemalloc', False): tracemalloc.stop()
+        try:
+            report_id, raw_id = save_request_profile(profiler, peak_bytes)
+        finally:
+            _profile_lock.release()
+        response.headers['X-Profile-URL'] = url_for('download', file_id=report_id)
+        response.headers['X-Profile-Data-URL'] = url_for('download', file_id=raw_id)
+
+    # Server-Timing shows the per-stage breakdown in the browser's network panel
+    timings = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in g.get('stage_timings', [])]
+    if 'request_start' in g:
+        timings.append(f"total;dur={(time.perf_counter() - g.request_start) * 1000:.2f}")
+    if timings: response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+@app.teardown_request
+def abandon_request_profile(exc):
+    # after_request is skipped when a view raises; don't leave the profiler running
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        if g.pop('started_tracemalloc', False): tracemalloc.stop()
+        _profile_lock.release()
+
+@app.after_request
+def record_conversion_metrics(response):
+    # Accepted jobs are recorded by run_job() when they finish
+    if request.endpoint in ('convert_to_csv', 'convert_to_json', 'convert_batch') or (request.endpoint == 'submit_job' and response.status_code != 202):
+        conversion = g.get('conversion', {})
+        if response.status_code == 503: outcome = 'rejected'
+        elif response.status_code >= 400: outcome = 'error'
+        elif conversion.get('cached'): outcome = 'cached'
+        else: outcome = 'ok'
+        METRICS.record_conversion(
+            request.endpoint, outcome, g.get('stage_timings', []),
+            conversion.get('bytes_in', 0), conversion.get('bytes_out', 0),
+            conversion.get('rows', 0), conversion.get('columns', 0),
+        )
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/download/<file_id>')
+def download(file_id):
+    result = RESULT_STORE.get(file_id)
+    if result is None: return jsonify({"error": "File not found or expired."}), 404
+    path, meta = result
+    compressible = meta['mimetype'] in COMPRESSIBLE_MIMETYPES
+    encoding = negotiate_encoding(STREAM_ENCODINGS) if compressible else 'identity'
+    if encoding != 'identity' and os.path.getsize(path) >= COMPRESSION_MIN_BYTES:
+        # Each encoding is compressed once into a file of its own, so it has its
+        # own length and validators and resumes work on the encoded bytes too.
+        # Until it exists the compressed bytes are streamed as they are made.
+        path, chunks = RESULT_STORE.variant(file_id, encoding, lambda src: iter_compressed(iter_file(src), encoding))
+        if path is None:
+            response = Response(chunks, mimetype=meta['mimetype'], headers={
+                "Content-Disposition": attachment_disposition(meta['download_name']),
+                "Content-Encoding": encoding,
+                "Cache-Control": 'no-cache, max-age=0',
+            })
+            response.vary.add('Accept-Encoding')
+            return response
+    else:
+        encoding = 'identity'
+    # conditional=True gives ETag and Range/If-Range (resumable) support, and the
+    # file is handed to the server's wsgi.file_wrapper (sendfile under gunicorn).
+    response = send_file(
+        path,
+        mimetype=meta['mimetype'],
+        as_attachment=True,
+        download_name=meta['download_name'],
+        conditional=True,
+        max_age=0,
+    )
+    if encoding != 'identity': response.headers['Content-Encoding'] = encoding
+    if compressible: response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/preview/<file_id>')
+def preview(file_id):
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = min(int(request.args.get('page_size', PREVIEW_PAGE_SIZE)), PREVIEW_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "page and page_size must be whole numbers."}), 400
+    if page < 1 or page_size < 1: return jsonify({"error": "page and page_size must be at least 1."}), 400
+    order = request.args.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'): return jsonify({"error": "order must be 'asc' or 'desc'."}), 400
+    sort, column, query = request.args.get('sort') or None, request.args.get('column') or None, request.args.get('q', '')
+    if query and column is None: return jsonify({"error": "Choose a column to filter on."}), 400
+    if not ResultStore.FILE_ID.match(file_id): return jsonify({"error": "File not found or expired."}), 404
+    try:
+        result = preview_page(file_id, page, page_size, sort, order == 'desc', column, query)
+    except ConversionError as e:
+        return jsonify({"error": str(e)}), e.status, e.headers
+    except (ValueError, TypeError, NotImplementedError) as e:
+        return jsonify({"error": f"Cannot preview this result: {e}"}), 400
+    if result is None: return jsonify({"error": "File not found or expired."}), 404
+    return jsonify(result)
 
 # This block is for local development. On Render, Gunicorn will run the 'app' object.
 if __name__ == '__main__':
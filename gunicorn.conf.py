@@ -0,0 +1,6 @@
+# gunicorn.conf.py - read automatically when gunicorn is started from this directory.
+
+# Import convert.py (and pandas with it) once in the master process; workers are
+# forked with everything already loaded, so a new worker can serve immediately.
+# Per-worker state (mail sender thread, metrics file) is set up after the fork.
+preload_app = True